@@ -0,0 +1,383 @@
+"""
+切片圆拟合：Kåsa 代数拟合 + RANSAC 兜底，供 pit_pipeline_analysis 与 final_radium_compute 共用。
+RANSAC 依次使用 Cython/AVX2 内核 (ransac_kernel)、numba JIT 内核，都不可用时退回 NumPy 向量化实现。
+"""
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba 为可选依赖，缺失时 RANSAC 使用 NumPy 向量化实现
+    njit = None
+
+try:  # 可选的 Cython/AVX2 内核 (python tools/build.py --kernel)，优先于 numba
+    from algo import ransac_kernel
+except ImportError:
+    try:
+        import ransac_kernel
+    except ImportError:
+        ransac_kernel = None
+if ransac_kernel is not None and not ransac_kernel.cpu_supported():
+    ransac_kernel = None
+
+# --- 批量三点拟合圆 (向量化) ---
+def fit_circles_from_3_points_batch(sample_xs, sample_ys):
+    """
+    一次性计算 M 组三点的拟合圆，代数与 numba 内核的 _fit3 完全一致。
+
+    参数:
+    sample_xs (np.array): 形状 (M, 3) 的采样点 X 坐标。
+    sample_ys (np.array): 形状 (M, 3) 的采样点 Y 坐标。
+
+    返回:
+    tuple: (center_x, center_y, radius, valid)，均为 (M,) 数组；valid 为 False 表示该组无效。
+    """
+    x1, y1 = sample_xs[:, 0], sample_ys[:, 0]
+    x2, y2 = sample_xs[:, 1], sample_ys[:, 1]
+    x3, y3 = sample_xs[:, 2], sample_ys[:, 2]
+
+    temp = x2**2 + y2**2
+    bc = (x1**2 + y1**2 - temp) / 2
+    cd = (temp - x3**2 - y3**2) / 2
+    det = (x1 - x2) * (y2 - y3) - (x2 - x3) * (y1 - y2)
+
+    # 三点共线 (含重复采样到同一点) 的组行列式为 0，标记为无效
+    valid = np.abs(det) >= 1.0e-6
+    det = np.where(valid, det, 1.0)
+
+    center_x = (bc * (y2 - y3) - cd * (y1 - y2)) / det
+    center_y = (cd * (x1 - x2) - bc * (x2 - x3)) / det
+
+    radius_sq = (x1 - center_x)**2 + (y1 - center_y)**2
+    # 半径过小 (退化) 或过大 (数值溢出) 的组视为无效，与 _fit3 及 AVX2 内核一致
+    valid &= (radius_sq >= 1.0e-12) & (radius_sq <= 1.0e10)
+
+    return center_x, center_y, np.sqrt(radius_sq), valid
+
+# --- 内点环带的平方上下界 ---
+def inlier_band_sq(radius, threshold):
+    """
+    返回 |d - r| < threshold 对应的平方距离开区间 (lo_sq, hi_sq)。
+    - r <= threshold 时内侧无约束，下界取 -1。
+    """
+    lo_sq = np.where(radius > threshold, (radius - threshold)**2, -1.0)
+    return lo_sq, (radius + threshold)**2
+
+# 单批 (假设数 x 点数) 距离矩阵的元素上限，约 16MB/float64 临时数组
+RANSAC_MAX_BATCH_ELEMENTS = 1 << 21
+# 单批假设数上限，使自适应提前终止能及时生效
+RANSAC_MAX_BATCH_SIZE = 256
+# 自适应终止的置信度 p：N = log(1 - p) / log(1 - w³)
+RANSAC_CONFIDENCE = 0.999
+
+# --- RANSAC 自适应迭代次数 ---
+def ransac_required_iterations(inlier_count, num_points):
+    """
+    按当前最优内点率 w = inlier_count / num_points 估计所需迭代次数。
+    - 以 RANSAC_CONFIDENCE 的概率至少抽到一组全为内点的三点样本。
+    """
+    w = inlier_count / num_points
+    return int(np.ceil(np.log(1 - RANSAC_CONFIDENCE) / np.log(max(1 - w**3, 1.0e-12))))
+
+# --- 假设圆的参数范围 ---
+def hypothesis_bounds(xs, ys, radius_range=None):
+    """
+    半径须在调用方给出的先验范围 [R_min, R_max] 内，圆心须落在切片 AABB 外扩 R_max 的范围内。
+    - 范围外的假设在 O(N) 的内点统计之前直接剔除。
+    - 范围不能由切片自身的范围推出：切片只扫到一段坑壁 (圆弧) 时，真实半径会大于 AABB 半对角线，
+      圆心也会落在 AABB 之外。radius_range 为 None 时不做预筛。
+    
+    返回:
+    tuple: (x_lo, x_hi, y_lo, y_hi, radius_min, radius_max)。
+    """
+    if radius_range is None:
+        return -np.inf, np.inf, -np.inf, np.inf, 0.0, np.inf
+    radius_min, radius_max = float(radius_range[0]), float(radius_range[1])
+    x_min, x_max = float(xs.min()), float(xs.max())
+    y_min, y_max = float(ys.min()), float(ys.max())
+    return x_min - radius_max, x_max + radius_max, y_min - radius_max, y_max + radius_max, radius_min, radius_max
+
+# --- RANSAC 三点采样索引 ---
+def sample_index_triples(num_points, count):
+    """
+    一次性生成 count 组三点采样索引，取代逐次调用 random.sample。
+    - 含重复索引的退化组直接剔除，返回 (M, 3) int32 数组，M <= count。
+    """
+    seeds = np.random.default_rng().integers(0, num_points, size=(count, 3), dtype=np.int32)
+    good = (seeds[:, 0] != seeds[:, 1]) & (seeds[:, 1] != seeds[:, 2]) & (seeds[:, 0] != seeds[:, 2])
+    return seeds[good]
+
+# --- RANSAC 的 NumPy 向量化实现 (编译内核均不可用时使用) ---
+def _ransac_circle_fit_numpy(xs, ys, seeds, threshold, bounds):
+    """
+    所有假设按批次向量化评估，避免逐次迭代的 Python 解释器开销；
+    每批后按当前最优内点率更新所需迭代次数，满足置信度即提前终止。
+    seeds 为 sample_index_triples 生成的采样索引，bounds 为 hypothesis_bounds 的返回值，
+    其余参数与返回值同 ransac_circle_fit。
+    """
+    best_circle = None
+    best_inlier_count = 0
+    num_points = xs.shape[0]
+    iterations = seeds.shape[0]
+
+    x_lo, x_hi, y_lo, y_hi, radius_min, radius_max = bounds
+
+    # 批大小受 (batch, N) 距离矩阵的内存上限约束
+    batch_size = max(1, min(iterations, RANSAC_MAX_BATCH_SIZE, RANSAC_MAX_BATCH_ELEMENTS // num_points))
+
+    required = iterations
+    start = 0
+    while start < required:
+        batch = min(batch_size, required - start)
+
+        # 取出本批 batch 组预生成的三点索引
+        sample_indices = seeds[start:start + batch]
+        start += batch
+
+        # 批量拟合圆
+        center_x, center_y, radius, valid = fit_circles_from_3_points_batch(xs[sample_indices], ys[sample_indices])
+
+        # 参数范围预筛：圆心或半径越界的假设不做内点统计
+        valid &= (center_x >= x_lo) & (center_x <= x_hi) & (center_y >= y_lo) & (center_y <= y_hi)
+        valid &= (radius >= radius_min) & (radius <= radius_max)
+
+        if not valid.any():
+            continue
+        center_x, center_y, radius = center_x[valid], center_y[valid], radius[valid]
+
+        # 批量计算所有点到各假设圆心的平方距离，形状 (batch, N)；就地平方累加，减少临时数组
+        dist_sq = xs[None, :] - center_x[:, None]
+        np.square(dist_sq, out=dist_sq)
+        dy = ys[None, :] - center_y[:, None]
+        np.square(dy, out=dy)
+        dist_sq += dy
+
+        # 检查点到圆周的距离是否在阈值内：|d - r| < t 等价于 (r - t)² < d² < (r + t)²，省去 sqrt/abs
+        # (半径不大于阈值时内侧无约束，即检查点是否落在圆心附近)
+        lo_sq, hi_sq = inlier_band_sq(radius, threshold)
+        inlier_counts = np.count_nonzero((dist_sq > lo_sq[:, None]) & (dist_sq < hi_sq[:, None]), axis=1)
+
+        # 更新最佳模型
+        best = np.argmax(inlier_counts)
+        if inlier_counts[best] > best_inlier_count:
+            best_inlier_count = inlier_counts[best]
+            best_circle = (center_x[best], center_y[best], radius[best])
+            required = min(iterations, ransac_required_iterations(best_inlier_count, num_points))
+            
+    # 如果找到的内点少于一个较低的百分比，也可以认为拟合失败，这里保持宽松处理
+    # 只要找到了最佳模型，就返回它
+    return best_circle
+
+# --- RANSAC 的 numba JIT 内核 ---
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _fit3(x1, y1, x2, y2, x3, y3):
+        """
+        标量版三点拟合圆，代数与 fit_circles_from_3_points_batch 一致，不分配任何数组。
+        返回 (ok, center_x, center_y, radius_sq)，开方留给通过预筛的调用方。
+        """
+        temp = x2 * x2 + y2 * y2
+        bc = (x1 * x1 + y1 * y1 - temp) / 2
+        cd = (temp - x3 * x3 - y3 * y3) / 2
+        det = (x1 - x2) * (y2 - y3) - (x2 - x3) * (y1 - y2)
+        if abs(det) < 1.0e-6:
+            return False, 0.0, 0.0, 0.0
+
+        center_x = (bc * (y2 - y3) - cd * (y1 - y2)) / det
+        center_y = (cd * (x1 - x2) - bc * (x2 - x3)) / det
+
+        radius_sq = (x1 - center_x) ** 2 + (y1 - center_y) ** 2
+        # 退化 (半径≈0) 与数值溢出的假设都拒绝，与批量解算及 AVX2 内核一致
+        if radius_sq < 1.0e-12 or radius_sq > 1.0e10:
+            return False, 0.0, 0.0, 0.0
+        return True, center_x, center_y, radius_sq
+
+    # nogil: 由切片级线程池并行调用；内核内部不再 prange，避免嵌套并行超额订阅
+    @njit(nogil=True, cache=True, fastmath=True)
+    def _ransac_njit(xs, ys, threshold, seeds, bounds):
+        """
+        依次评估 seeds 中的假设，最优模型更新时按自适应规则缩减所需迭代次数。
+        bounds 为 hypothesis_bounds 的返回值，越界假设不做内点统计。
+        返回 (best_count, center_x, center_y, radius)。
+        """
+        x_lo, x_hi, y_lo, y_hi, radius_min, radius_max = bounds
+        radius_min_sq = radius_min * radius_min
+        radius_max_sq = radius_max * radius_max
+        iterations = seeds.shape[0]
+        num_points = xs.shape[0]
+        best_count = 0
+        best_cx, best_cy, best_r = 0.0, 0.0, 0.0
+
+        required = iterations
+        i = 0
+        while i < required:
+            a, b, c = seeds[i, 0], seeds[i, 1], seeds[i, 2]
+            i += 1
+            ok, cx, cy, r_sq = _fit3(xs[a], ys[a], xs[b], ys[b], xs[c], ys[c])
+            # 越界判定用半径平方，sqrt 只对通过预筛的假设计算 (环带上下界需要 r)
+            if (not ok or cx < x_lo or cx > x_hi or cy < y_lo or cy > y_hi
+                    or r_sq < radius_min_sq or r_sq > radius_max_sq):
+                continue
+            r = np.sqrt(r_sq)
+
+            # 平方距离环带判定，省去每点一次 sqrt
+            lo_sq = (r - threshold) ** 2 if r > threshold else -1.0
+            hi_sq = (r + threshold) ** 2
+            count = 0
+            for j in range(num_points):
+                dx = xs[j] - cx
+                dy = ys[j] - cy
+                d2 = dx * dx + dy * dy
+                if d2 > lo_sq and d2 < hi_sq:
+                    count += 1
+
+            if count > best_count:
+                best_count = count
+                best_cx, best_cy, best_r = cx, cy, r
+                w = best_count / num_points
+                needed = np.ceil(np.log(1 - RANSAC_CONFIDENCE) / np.log(max(1 - w ** 3, 1.0e-12)))
+                required = min(iterations, int(needed))
+
+        return best_count, best_cx, best_cy, best_r
+else:
+    _ransac_njit = None
+
+# --- RANSAC 核心算法 ---
+def ransac_circle_fit(xs, ys, iterations, threshold, radius_range=None):
+    """
+    RANSAC 算法：从二维点云数据中拟合圆。
+    依次尝试 Cython/AVX2 内核、numba JIT 内核，都不可用时退回 NumPy 向量化实现。
+    
+    参数:
+    xs (np.array): 点的 X 坐标，一维连续数组 (N,)。
+    ys (np.array): 点的 Y 坐标，一维连续数组 (N,)。
+    iterations (int): RANSAC 迭代次数 (已增加)。
+    threshold (float): 点到圆周的最大距离，用于判定内点 (已放宽)。
+    radius_range (tuple): 先验半径范围 (R_min, R_max)，用于假设预筛；None 表示不预筛。
+    
+    返回:
+    tuple: (center_x, center_y, radius) 或 None。
+    """
+    num_points = xs.shape[0]
+
+    if num_points < 3:
+        return None
+
+    # 采样索引在 Python 侧一次性预先生成，各实现共用
+    seeds = sample_index_triples(num_points, iterations)
+    bounds = hypothesis_bounds(xs, ys, radius_range)
+    kernel = ransac_kernel.run if ransac_kernel is not None else _ransac_njit
+    if kernel is not None:
+        best_count, center_x, center_y, radius = kernel(
+            np.ascontiguousarray(xs, dtype=np.float32), np.ascontiguousarray(ys, dtype=np.float32),
+            threshold, seeds, bounds
+        )
+        return (center_x, center_y, radius) if best_count > 0 else None
+
+    return _ransac_circle_fit_numpy(xs, ys, seeds, threshold, bounds)
+
+# Kåsa 系数矩阵 (缩放后) 的条件数上限，即法方程 AᵀA 条件数上限 1e4；
+# 缩放后条件数约等于点集长度与法向厚度之比：2cm 噪声下 30°~360° 的圆弧在 4~25，共线点集远超 100
+KASA_MAX_COND = 100.0
+# Kåsa 半径与数据 AABB 半对角线之比的上限：
+# 只扫到一段坑壁时半径本就大于半对角线 (90° 弧约 1.4 倍，30° 弧约 3.9 倍)，超过 5 倍视为近共线的退化解
+KASA_MAX_RADIUS_FACTOR = 5.0
+
+# --- Kåsa 代数最小二乘圆拟合 ---
+def kasa_fit(xs, ys):
+    """
+    Kåsa 方法：求解线性方程组 [x, y, 1]·c = x² + y²，一次得到圆心和半径。
+    - 先平移到质心、按 AABB 半对角线缩放再求解，改善数值条件。
+    - 共线或近共线的点集会解出有限但无意义的大圆，以下情况视为拟合失败：
+      系数矩阵条件数超过 KASA_MAX_COND，或半径超过 AABB 半对角线的 KASA_MAX_RADIUS_FACTOR 倍。
+    
+    参数:
+    xs (np.array): 点的 X 坐标 (N,)。
+    ys (np.array): 点的 Y 坐标 (N,)。
+    
+    返回:
+    tuple: (center_x, center_y, radius) 或 None。
+    """
+    num_points = xs.shape[0]
+    if num_points < 3:
+        return None
+
+    origin_x, origin_y = xs.mean(), ys.mean()
+    half_diagonal = 0.5 * np.hypot(xs.max() - xs.min(), ys.max() - ys.min())
+    if not half_diagonal > 0:
+        return None
+    local_xs, local_ys = (xs - origin_x) / half_diagonal, (ys - origin_y) / half_diagonal
+    A = np.column_stack([local_xs, local_ys, np.ones(num_points, dtype=local_xs.dtype)])
+    b = local_xs**2 + local_ys**2
+    c, _, rank, singular_values = np.linalg.lstsq(A, b, rcond=None)
+    # cond(A) = s_max / s_min；法方程 AᵀA 的条件数为其平方
+    if rank < 3 or singular_values[0] > KASA_MAX_COND * singular_values[-1]:
+        return None
+
+    cx, cy = c[0] / 2, c[1] / 2
+    radius_sq = c[2] + cx**2 + cy**2
+    if not np.isfinite(radius_sq) or radius_sq < 1.0e-12 or radius_sq > KASA_MAX_RADIUS_FACTOR**2:
+        return None
+
+    return cx * half_diagonal + origin_x, cy * half_diagonal + origin_y, np.sqrt(radius_sq) * half_diagonal
+
+# Kåsa 拟合后阈值内点比例低于该值时，认为离群点过多，退回 RANSAC
+MIN_INLIER_RATIO = 0.5
+# 3σ 剔除-重拟合的最大轮数 (剔除集合不再变化时提前结束)
+KASA_MAX_TRIM_PASSES = 10
+
+# --- 切片圆拟合入口 ---
+def fit_circle(xs, ys, iterations, threshold, radius_range=None):
+    """
+    切片圆拟合：Kåsa 拟合 -> 剔除残差超过 3σ 的点 -> 重新拟合，直至剔除集合稳定。
+    若结果在阈值内的点不足 MIN_INLIER_RATIO，则用 RANSAC 剔除离群点，
+    再对 RANSAC 的内点做一次 Kåsa 精化。
+    
+    参数:
+    xs (np.array): 点的 X 坐标 (N,)。
+    ys (np.array): 点的 Y 坐标 (N,)。
+    iterations (int): 兜底 RANSAC 的迭代次数。
+    threshold (float): 点到圆周的最大距离，用于判定内点。
+    radius_range (tuple): 先验半径范围 (R_min, R_max)，传给兜底 RANSAC 做假设预筛；None 表示不预筛。
+    
+    返回:
+    tuple: (center_x, center_y, radius) 或 None。
+    """
+    circle = kasa_fit(xs, ys)
+    keep = np.ones(xs.shape[0], dtype=bool)
+    for _ in range(KASA_MAX_TRIM_PASSES):
+        if circle is None:
+            break
+        cx, cy, radius = circle
+        residuals = np.hypot(xs - cx, ys - cy) - radius
+        new_keep = np.abs(residuals) <= 3 * residuals[keep].std()
+        if np.array_equal(new_keep, keep):
+            break
+        keep = new_keep
+        circle = kasa_fit(xs[keep], ys[keep])
+
+    if circle is not None:
+        cx, cy, radius = circle
+        residuals = np.hypot(xs - cx, ys - cy) - radius
+        if np.count_nonzero(np.abs(residuals) < threshold) >= MIN_INLIER_RATIO * xs.shape[0]:
+            return circle
+
+    # 离群点过多：RANSAC 兜底
+    circle = ransac_circle_fit(xs, ys, iterations=iterations, threshold=threshold, radius_range=radius_range)
+    if circle is None:
+        return None
+
+    cx, cy, radius = circle
+    inliers = np.abs(np.hypot(xs - cx, ys - cy) - radius) < threshold
+    refined = kasa_fit(xs[inliers], ys[inliers])
+    return refined if refined is not None else circle
+
+# --- 已排序数组的分位数 ---
+def sorted_percentile(sorted_values, q):
+    """
+    对已升序排列的数组按下标线性插值取 q 分位数。
+    - 结果与 np.percentile 的默认 (linear) 方法一致，但省去了排序/选择，O(1)。
+    """
+    pos = q / 100.0 * (sorted_values.size - 1)
+    k = int(pos)
+    k_next = min(k + 1, sorted_values.size - 1)
+    return sorted_values[k] + (pos - k) * (sorted_values[k_next] - sorted_values[k])
@@ -1,125 +1,58 @@
+import logging
 import numpy as np
-import random
 import open3d as o3d
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
-# --- 辅助函数 1：三点拟合圆 (已优化数值稳定性) ---
-def fit_circle_from_3_points(p1, p2, p3):
-    """
-    根据三个不共线的点来计算一个圆的圆心和半径。
-    - 针对三点共线和数值溢出进行了鲁棒性处理。
-    """
-    # 转换为浮点数，防止后续计算中出现整数溢出
-    p1, p2, p3 = np.array(p1, dtype=float), np.array(p2, dtype=float), np.array(p3, dtype=float)
-
-    # 计算行列式 (det) 所需的中间变量
-    temp = p2[0]**2 + p2[1]**2
-    bc = (p1[0]**2 + p1[1]**2 - temp) / 2
-    cd = (temp - p3[0]**2 - p3[1]**2) / 2
-    det = (p1[0] - p2[0]) * (p2[1] - p3[1]) - (p2[0] - p3[0]) * (p1[1] - p2[1])
+try:
+    from algo.circle_fit import fit_circle, sorted_percentile
+except ImportError:  # 在 src/algo 目录下直接运行本脚本时
+    from circle_fit import fit_circle, sorted_percentile
 
-    # 检查三点共线 (如果行列式接近零，则认为共线)
-    if abs(det) < 1.0e-6: 
-        return None, None # 三点共线
-
-    # 计算圆心坐标
-    center_x = (bc * (p2[1] - p3[1]) - cd * (p1[1] - p2[1])) / det
-    center_y = (cd * (p1[0] - p2[0]) - bc * (p2[0] - p3[0])) / det
-    
-    # 计算半径
-    radius_sq = (p1[0] - center_x)**2 + (p1[1] - center_y)**2
-    
-    # 检查半径是否在合理范围内 (防止数值溢出或得到无效结果)
-    if radius_sq < 1.0e-12: 
-        radius = 0.0
-    elif radius_sq > 1.0e10: # 如果半径平方超过 10^10，视为无效拟合
-        return None, None
-    else:
-        radius = np.sqrt(radius_sq)
-
-    return (center_x, center_y), radius
-
-# --- 辅助函数 2：RANSAC 核心算法 ---
-def ransac_circle_fit(points, iterations, threshold):
-    """
-    RANSAC 算法：从二维点云数据中拟合圆。
-    
-    参数:
-    points (np.array): 包含 (x, y) 坐标的 NumPy 数组 (N, 2)。
-    iterations (int): RANSAC 迭代次数 (已增加)。
-    threshold (float): 点到圆周的最大距离，用于判定内点 (已放宽)。
-    
-    返回:
-    tuple: (center_x, center_y, radius) 或 None。
-    """
-    best_circle = None
-    best_inlier_count = 0
-    num_points = points.shape[0]
-
-    if num_points < 3:
-        return None
-
-    for _ in range(iterations):
-        # 随机选择 3 个点
-        sample_indices = random.sample(range(num_points), 3)
-        p1, p2, p3 = points[sample_indices[0]], points[sample_indices[1]], points[sample_indices[2]]
-
-        # 尝试拟合圆
-        center, radius = fit_circle_from_3_points(p1, p2, p3)
-
-        if center is None or radius is None:
-            continue
-
-        # 计算内点数量
-        current_inlier_count = 0
-        
-        # 批量计算点到圆心的距离
-        dist_to_center = np.sqrt((points[:, 0] - center[0])**2 + (points[:, 1] - center[1])**2)
-        
-        # 检查点到圆周的距离是否在阈值内
-        if radius == 0:
-             # 如果半径为 0，则检查点是否落在圆心附近
-             inlier_mask = dist_to_center < threshold 
-        else:
-             inlier_mask = np.abs(dist_to_center - radius) < threshold
-             
-        current_inlier_count = np.sum(inlier_mask)
-        
-        # 更新最佳模型
-        if current_inlier_count > best_inlier_count:
-            best_inlier_count = current_inlier_count
-            best_circle = (center[0], center[1], radius)
-            
-    # 如果找到的内点少于一个较低的百分比，也可以认为拟合失败，这里保持宽松处理
-    # 只要找到了最佳模型，就返回它
-    return best_circle
+# 调试信息走 logging：级别未开启时不做字符串格式化
+logger = logging.getLogger(__name__)
 
 # --- 核心分析函数：基坑分层计算 ---
 def analyze_pit_pcd(pcd_filepath, z_interval=1.0, slice_thickness=0.30, 
-                    ransac_iterations=5000, ransac_threshold=0.2):
+                    ransac_iterations=5000, ransac_threshold=0.2, voxel_size=0.02,
+                    radius_range=None):
     """
     分析 PCD 文件，计算坑深、并按深度分层计算半径。
     坐标系假设: Z轴向下为正，原点(0,0,0)为坑口圆心。
+    voxel_size > 0 时先做体素下采样：体素越大越快，但切片点数与深度分辨率降低，
+    质心带来的半径偏差约 voxel_size² / (8R)；体素边长应明显小于 slice_thickness 与 ransac_threshold。
+    radius_range 为先验半径范围 (R_min, R_max)，用于 RANSAC 假设预筛；None 表示不预筛。
     """
     
     # 1. 数据导入与转换
     print(f"1. 正在加载文件: {pcd_filepath}")
-    pcd = o3d.io.read_point_cloud(pcd_filepath)
-    if not pcd.has_points():
+    # tensor API 读取：坐标保持文件中的类型 (float32 或 float64)，不经 legacy 的 Vector3dVector 转换；
+    # 下面按 Z 排序时 all_points[order, k] 会拷贝一次并统一转为 float32
+    pcd = o3d.t.io.read_point_cloud(pcd_filepath)
+    if pcd.is_empty():
         return None, None, "错误: PCD 文件中没有点云数据。"
+
+    if voxel_size > 0:
+        num_raw = pcd.point.positions.shape[0]
+        pcd = pcd.voxel_down_sample(voxel_size=voxel_size)
+        print(f"   体素下采样 (voxel_size={voxel_size}): {num_raw} -> {pcd.point.positions.shape[0]} 点")
     
-    all_points = np.asarray(pcd.points) # 形状 (N, 3)，即 (X, Y, Z)
+    all_points = pcd.point.positions.numpy() # 形状 (N, 3)，即 (X, Y, Z)
+    # 一次性按 Z 排序并转为连续的 float32 SoA 布局：
+    # 每个切片都是 [lo, hi) 的连续区间，切片和拟合只访问 X/Y 两个一维视图
+    order = np.argsort(all_points[:, 2])
+    xs, ys, zs = (np.ascontiguousarray(all_points[order, k], dtype=np.float32) for k in range(3))
 
     # 2. 计算坑深
-    z_values = all_points[:, 2]
     # 过滤掉 Z<=0 的点（在 Z 向下的坐标系中，Z=0 是坑口）
-    pit_points_mask = z_values > 0.01 
-    pit_z_values = z_values[pit_points_mask]
+    # zs 已升序排列，Z > 0.01 的点是尾部的连续视图，无需布尔掩码拷贝
+    pit_z_values = zs[np.searchsorted(zs, 0.01, side='right'):]
 
     if pit_z_values.size == 0:
         return 0, None, "错误: Z轴正值区域（基坑内部）没有有效点云。"
         
-    pit_depth = np.percentile(pit_z_values, 99.5)
+    pit_depth = sorted_percentile(pit_z_values, 99.5)
     print(f"2. 估计坑深 (99.5% Z值): {pit_depth:.3f} 米")
 
     # 3. 定义分层深度
@@ -130,42 +63,53 @@ def analyze_pit_pcd(pcd_filepath, z_interval=1.0, slice_thickness=0.30,
     if slice_centers.size == 0:
         return pit_depth, None, "警告: 间隔或 Z 范围太小，无法分层计算半径。"
 
-    # 4. 循环拟合
-    results = [] # 存储 (Z, Radius, Center_X, Center_Y)
+    # 4. 收集切片，再并行拟合
+    tasks = [] # 存储 (Z, 切片 X, 切片 Y)
     
     print(f"3. 正在按 {z_interval}m 间隔分层拟合 ({slice_centers.size} 层)...")
     
-    for z_center in slice_centers:
-        min_z = z_center - slice_thickness / 2
-        max_z = z_center + slice_thickness / 2
-        
-        mask = (all_points[:, 2] >= min_z) & (all_points[:, 2] <= max_z)
-        sliced_points = all_points[mask]
+    # 所有切片边界一次向量化求出，切片即 [lo, hi) 区间 (切片厚度大于间隔时区间可重叠)
+    slice_lo = np.searchsorted(zs, slice_centers - slice_thickness / 2, side='left')
+    slice_hi = np.searchsorted(zs, slice_centers + slice_thickness / 2, side='right')
+    
+    for z_center, lo, hi in zip(slice_centers, slice_lo, slice_hi):
+        slice_xs, slice_ys = xs[lo:hi], ys[lo:hi] # 投影到 X-Y 平面
         
         # 极低点数限制 (只有少于 3 个点时才跳过)
-        if sliced_points.shape[0] < 3: 
-            print(f"警告: Z={z_center:.2f}m 处点数不足 ({sliced_points.shape[0]} < 3)，跳过拟合。")
+        if slice_xs.shape[0] < 3: 
+            print(f"警告: Z={z_center:.2f}m 处点数不足 ({slice_xs.shape[0]} < 3)，跳过拟合。")
             continue
         
-        # 调试信息
-        print(f"DEBUG: 正在拟合 Z={z_center:.2f}m 处，点数: {sliced_points.shape[0]}")
+        # 调试信息 (参数延迟格式化)
+        logger.debug("正在拟合 Z=%.2fm 处，点数: %d", z_center, slice_xs.shape[0])
         
-        points_2d = sliced_points[:, [0, 1]] # 投影到 X-Y 平面
-        
-        # RANSAC 拟合
-        fitted_circle = ransac_circle_fit(
-            points_2d, 
+        tasks.append((z_center, slice_xs, slice_ys))
+
+    def fit_slice(task):
+        z_center, slice_xs, slice_ys = task
+        # 圆拟合 (Kåsa 代数拟合，离群点过多时 RANSAC 兜底)
+        fitted_circle = fit_circle(
+            slice_xs, slice_ys, 
             iterations=ransac_iterations, 
-            threshold=ransac_threshold
+            threshold=ransac_threshold,
+            radius_range=radius_range
         )
-        
+        return z_center, fitted_circle
+
+    # 各切片相互独立，拟合主要在释放 GIL 的 NumPy/numba 代码中执行，用线程池并行；
+    # executor.map 保持切片顺序，每个任务只返回自己的结果
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        fitted = list(executor.map(fit_slice, tasks))
+
+    results = [] # 存储 (Z, Radius, Center_X, Center_Y)
+    for z_center, fitted_circle in fitted:
         if fitted_circle is not None:
             center_x, center_y, radius = fitted_circle
             results.append((z_center, radius, center_x, center_y))
     
     if not results:
         # 在返回错误信息时，依然返回已计算出的深度，方便调试
-        return pit_depth, None, "错误: RANSAC 拟合在所有切片上都失败了。"
+        return pit_depth, None, "错误: 圆拟合在所有切片上都失败了。"
 
     # 5. 汇总结果
     results_array = np.array(results)
@@ -189,6 +133,7 @@ if __name__ == '__main__':
         sys.exit(1) # 退出程序，提示用户提供文件路径
         
     PCD_FILE = sys.argv[1] # 从命令行参数获取 PCD 文件路径
+    logging.basicConfig(level=logging.DEBUG, format="%(levelname)s: %(message)s")
     # <--- 修改结束 --->
     try:
         # 参数设定: 提高鲁棒性
@@ -198,7 +143,9 @@ if __name__ == '__main__':
             z_interval=1.0,           
             slice_thickness=0.30,      # 切片厚度 30cm (增加点云数量)
             ransac_iterations=5000,    # 增加迭代次数 (克服共线问题)
-            ransac_threshold=0.2       # 内点阈值 20cm (容忍形状不规则性)
+            ransac_threshold=0.2,      # 内点阈值 20cm (容忍形状不规则性)
+            voxel_size=0.02,           # 体素下采样 2cm，0 表示不下采样
+            radius_range=(0.2, 6.0)    # 先验半径范围 (R_min, R_max)
         )
 
         if len(return_values) == 6:
@@ -234,13 +181,15 @@ if __name__ == '__main__':
 
 #类别,要求,说明
 #Python版本：3.6 或更高,建议使用 Python 3.6 ~ 3.12 版本区间。
-#依赖库：numpy,用于高效的数值计算和数组操作。open3d,用于 PCD 文件的导入和点云数据的处理。random,用于 RANSAC 算法中的随机采样。
+#依赖库：numpy,用于高效的数值计算和数组操作。open3d,用于 PCD 文件的导入和点云数据的处理。circle_fit,共用的切片圆拟合 (Kåsa + RANSAC 兜底)；其 RANSAC 可选使用 numba JIT 内核，或由 tools/build.py --kernel 编译的 Cython/AVX2 内核 (ransac_kernel，优先于 numba)。
 #入参：
 #pcd_filepath,str,输入：要加载的 PCD 文件路径。
 #z_interval,float,输入：切片间隔，单位为米。
 #slice_thickness,float,输入：切片厚度，单位为米。
-#ransac_iterations,int,输入：RANSAC 迭代次数。
+#ransac_iterations,int,输入：RANSAC 迭代次数 (仅在 Kåsa 拟合内点不足时兜底使用)。
 #ransac_threshold,float,输入：点到圆周的最大距离，用于判定内点。
+#voxel_size,float,输入：分析前体素下采样边长，单位为米；0 表示不下采样。
+#radius_range,tuple,输入：先验半径范围 (R_min, R_max)，单位为米；用于 RANSAC 假设预筛，None 表示不预筛。
 
 #文件输出：
 #1. 计算结果：
@@ -1,84 +1,90 @@
 import numpy as np
-import random
 import open3d as o3d
 import os
 import sys  
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from algo.circle_fit import fit_circle, sorted_percentile
+except ImportError:  # 在 src/algo 目录下直接运行本脚本时
+    from circle_fit import fit_circle, sorted_percentile
 
 # --- 1. 定义返回结构：新增 Min_Diameter ---
 PitMetrics = namedtuple('PitMetrics', ['depth', 'avg_diameter', 'min_diameter', 'verticality_deg'])
 
-# --- Part 1: RANSAC 辅助函数 (保持不变) ---
-def fit_circle_from_3_points(p1, p2, p3):
-    p1, p2, p3 = np.array(p1, dtype=float), np.array(p2, dtype=float), np.array(p3, dtype=float)
-    temp = p2[0]**2 + p2[1]**2
-    bc = (p1[0]**2 + p1[1]**2 - temp) / 2
-    cd = (temp - p3[0]**2 - p3[1]**2) / 2
-    det = (p1[0] - p2[0]) * (p2[1] - p3[1]) - (p2[0] - p3[0]) * (p1[1] - p2[1])
-    if abs(det) < 1.0e-6: 
-        return None, None
-    center_x = (bc * (p2[1] - p3[1]) - cd * (p1[1] - p2[1])) / det
-    center_y = (cd * (p1[0] - p2[0]) - bc * (p2[0] - p3[0])) / det
-    radius_sq = (p1[0] - center_x)**2 + (p1[1] - center_y)**2
-    if radius_sq < 1.0e-12 or radius_sq > 1.0e10: 
-        return None, None
-    else:
-        radius = np.sqrt(radius_sq)
-    return (center_x, center_y), radius
-
-def ransac_circle_fit(points, iterations, threshold):
-    best_circle = None
-    best_inlier_count = 0
-    num_points = points.shape[0]
-    if num_points < 3:
-        return None
-    for _ in range(iterations):
-        sample_indices = random.sample(range(num_points), 3)
-        p1, p2, p3 = points[sample_indices[0]], points[sample_indices[1]], points[sample_indices[2]]
-        center, radius = fit_circle_from_3_points(p1, p2, p3)
-        if center is None or radius is None:
-            continue
-        dist_to_center = np.sqrt((points[:, 0] - center[0])**2 + (points[:, 1] - center[1])**2)
-        inlier_mask = np.abs(dist_to_center - radius) < threshold
-        current_inlier_count = np.sum(inlier_mask)
-        if current_inlier_count > best_inlier_count:
-            best_inlier_count = current_inlier_count
-            best_circle = (center[0], center[1], radius)
-    return best_circle
-
-# --- Part 2: 边界框裁剪函数 (保持不变) ---
+# --- Part 1: 点云访问与边界框裁剪 (同时支持 legacy 与 tensor 点云) ---
+def point_count(pcd_object):
+    if isinstance(pcd_object, o3d.t.geometry.PointCloud):
+        return 0 if pcd_object.is_empty() else pcd_object.point.positions.shape[0]
+    return len(pcd_object.points)
+
+def point_positions(pcd_object):
+    """(N, 3) 坐标数组；tensor 点云通过 .numpy() 直接共享底层内存，不做拷贝。"""
+    if isinstance(pcd_object, o3d.t.geometry.PointCloud):
+        return pcd_object.point.positions.cpu().numpy()
+    return np.asarray(pcd_object.points)
+
 def crop_pcd_by_bbox(pcd_object, x_min, x_max, y_min, y_max, z_min, z_max):
-    if not pcd_object.has_points():
+    if point_count(pcd_object) == 0:
         return None
     min_bound = np.array([x_min, y_min, z_min]) 
     max_bound = np.array([x_max, y_max, z_max])
-    bbox = o3d.geometry.AxisAlignedBoundingBox(min_bound, max_bound)
+    if isinstance(pcd_object, o3d.t.geometry.PointCloud):
+        # 包围盒的 dtype/device 须与点坐标一致
+        positions = pcd_object.point.positions
+        bbox = o3d.t.geometry.AxisAlignedBoundingBox(
+            o3d.core.Tensor(min_bound, dtype=positions.dtype, device=positions.device),
+            o3d.core.Tensor(max_bound, dtype=positions.dtype, device=positions.device)
+        )
+    else:
+        bbox = o3d.geometry.AxisAlignedBoundingBox(min_bound, max_bound)
     pcd_cropped = pcd_object.crop(bbox)
-    print(f"裁剪完成。原始点数: {len(pcd_object.points)}, 裁剪后点数: {len(pcd_cropped.points)}")
-    if not pcd_cropped.has_points():
+    print(f"裁剪完成。原始点数: {point_count(pcd_object)}, 裁剪后点数: {point_count(pcd_cropped)}")
+    if point_count(pcd_cropped) == 0:
         return None
     return pcd_cropped
 
-# --- Part 3: 核心功能函数 (新增最小直径计算) ---
+# 分析前体素下采样的默认体素边长 (米)
+DEFAULT_VOXEL_SIZE = 0.02
+
+def voxel_downsample(pcd_object, voxel_size):
+    """
+    体素网格下采样，每个体素内的点以质心代替；voxel_size <= 0 时原样返回。
+    体素越大点越少、各阶段越快，但切片内点数与深度百分位的分辨率随之降低：
+    质心落在圆弧内侧带来的半径偏差约 voxel_size² / (8R)，0.02m 体素在 R≈1m 时可忽略；
+    体素边长应明显小于 slice_thickness 与 ransac_threshold。
+    """
+    if not voxel_size or voxel_size <= 0:
+        return pcd_object
+    pcd_down = pcd_object.voxel_down_sample(voxel_size=voxel_size)
+    print(f"体素下采样完成 (voxel_size={voxel_size})。下采样前点数: {point_count(pcd_object)}, 下采样后点数: {point_count(pcd_down)}")
+    return pcd_down
+
+# --- Part 2: 核心功能函数 (新增最小直径计算) ---
 def analyze_and_calculate_metrics(pcd_object, analysis_params):
     z_interval = analysis_params['z_interval']
     slice_thickness = analysis_params['slice_thickness']
     ransac_iterations = analysis_params['ransac_iterations']
     ransac_threshold = analysis_params['ransac_threshold']
+    radius_range = analysis_params.get('radius_range')
 
-    if pcd_object is None or not pcd_object.has_points():
+    if pcd_object is None or point_count(pcd_object) == 0:
         raise ValueError("错误: 传入的点云对象为空或不含点。")
         
-    all_points = np.asarray(pcd_object.points)
+    # 一次性按 Z 排序并转为连续的 float32 SoA 布局：
+    # 每个切片都是 [lo, hi) 的连续区间，切片和拟合只访问 X/Y 两个一维视图
+    all_points = point_positions(pcd_object)
+    order = np.argsort(all_points[:, 2])
+    xs, ys, zs = (np.ascontiguousarray(all_points[order, k], dtype=np.float32) for k in range(3))
 
     # 1. 计算总坑深 (Depth)
-    z_values = all_points[:, 2]
-    pit_points_mask = z_values > 0.01 
-    pit_z_values = z_values[pit_points_mask]
+    # zs 已升序排列，Z > 0.01 的点是尾部的连续视图，无需布尔掩码拷贝
+    pit_z_values = zs[np.searchsorted(zs, 0.01, side='right'):]
     if pit_z_values.size == 0:
         raise ValueError("错误: Z轴正值区域（基坑内部）没有有效点云，无法计算深度。")
         
-    depth = np.percentile(pit_z_values, 99.5)
+    depth = sorted_percentile(pit_z_values, 99.5)
     print(f"1. 估计总坑深 (Depth): {depth:.3f} 米")
 
     # 2. 深度分层和拟合
@@ -90,29 +96,34 @@ def analyze_and_calculate_metrics(pcd_object, analysis_params):
         print("警告: 间隔或 Z 范围太小，无法分层计算半径。")
         return PitMetrics(depth, None, None, None) 
 
-    results = [] 
-    
-    for z_center in slice_centers:
-        min_z = z_center - slice_thickness / 2
-        max_z = z_center + slice_thickness / 2
-        mask = (all_points[:, 2] >= min_z) & (all_points[:, 2] <= max_z)
-        sliced_points = all_points[mask]
-        
-        if sliced_points.shape[0] < 3: 
-            continue
-        
-        points_2d = sliced_points[:, [0, 1]] 
-        
-        fitted_circle = ransac_circle_fit(
-            points_2d, iterations=ransac_iterations, threshold=ransac_threshold
+    # 所有切片边界一次向量化求出，切片即 [lo, hi) 区间 (切片厚度大于间隔时区间可重叠)
+    slice_lo = np.searchsorted(zs, slice_centers - slice_thickness / 2, side='left')
+    slice_hi = np.searchsorted(zs, slice_centers + slice_thickness / 2, side='right')
+    tasks = [
+        (z_center, xs[lo:hi], ys[lo:hi])
+        for z_center, lo, hi in zip(slice_centers, slice_lo, slice_hi)
+        if hi - lo >= 3
+    ]
+
+    def fit_slice(task):
+        z_center, slice_xs, slice_ys = task
+        return z_center, fit_circle(
+            slice_xs, slice_ys, iterations=ransac_iterations, threshold=ransac_threshold,
+            radius_range=radius_range
         )
-        
-        if fitted_circle is not None:
-            center_x, center_y, radius = fitted_circle
-            results.append((z_center, radius, center_x, center_y))
+
+    # 各切片相互独立，拟合主要在释放 GIL 的 NumPy/numba 代码中执行，用线程池并行；
+    # executor.map 保持切片顺序
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        fitted = list(executor.map(fit_slice, tasks))
+
+    results = [
+        (z_center, circle[2], circle[0], circle[1])
+        for z_center, circle in fitted if circle is not None
+    ]
     
     if not results:
-        raise ValueError("错误: RANSAC 拟合在所有切片上都失败了，无法计算直径和垂直度。")
+        raise ValueError("错误: 圆拟合在所有切片上都失败了，无法计算直径和垂直度。")
 
     results_array = np.array(results) # (Z, Radius, Center_X, Center_Y)
 
@@ -128,8 +139,10 @@ def analyze_and_calculate_metrics(pcd_object, analysis_params):
     center_points = results_array[:, [2, 3, 0]] # (X, Y, Z)
     center_mean = np.mean(center_points, axis=0)
     center_points_centered = center_points - center_mean
-    U, S, V = np.linalg.svd(center_points_centered)
-    axis_vector = V[0] 
+    # 主轴 = 3x3 协方差矩阵最大特征值对应的特征向量，与 SVD 第一右奇异向量等价
+    cov = center_points_centered.T @ center_points_centered
+    eigvals, eigvecs = np.linalg.eigh(cov)
+    axis_vector = eigvecs[:, np.argmax(eigvals)]
     if axis_vector[2] < 0:
         axis_vector = -axis_vector
     z_axis = np.array([0.0, 0.0, 1.0])
@@ -147,12 +160,13 @@ def analyze_and_calculate_metrics(pcd_object, analysis_params):
     )
 
 
-# --- Part 4: 主执行逻辑 (保持不变) ---
+# --- Part 3: 主执行逻辑 (保持不变) ---
 def calculate_pit_pipeline(pcd_filepath, crop_params, analysis_params):
     try:
         print(f"1. 尝试加载原始文件: {pcd_filepath}")
-        pcd_original = o3d.io.read_point_cloud(pcd_filepath)
-        if not pcd_original.has_points():
+        # tensor API 读取：坐标保持文件中的类型 (float32 或 float64)，后续裁剪/下采样/取坐标都无需转 legacy
+        pcd_original = o3d.t.io.read_point_cloud(pcd_filepath)
+        if point_count(pcd_original) == 0:
             raise FileNotFoundError("错误: PCD 文件加载失败或不含点。")
             
         print("--- 裁剪预处理 ---")
@@ -161,8 +175,11 @@ def calculate_pit_pipeline(pcd_filepath, crop_params, analysis_params):
         if pcd_cropped is None:
             raise ValueError("流程中止：裁剪后点云为空。请检查 CROP_PARAMS。")
 
+        # 仅分析使用下采样点云
+        pcd_analysis = voxel_downsample(pcd_cropped, analysis_params.get('voxel_size', DEFAULT_VOXEL_SIZE))
+
         print("\n================== 开始基坑分析 ==================")
-        metrics = analyze_and_calculate_metrics(pcd_cropped, analysis_params)
+        metrics = analyze_and_calculate_metrics(pcd_analysis, analysis_params)
         
         return metrics
 
@@ -177,7 +194,7 @@ def calculate_pit_pipeline(pcd_filepath, crop_params, analysis_params):
         return None
 
 
-# --- Part 5: 新的包装函数 (内置 30m 规模参数) ---
+# --- Part 4: 新的包装函数 (内置 30m 规模参数) ---
 def quick_analyze_pit(pcd_filepath):
     """
     快速执行基坑点云分析，使用内置的默认参数 (适应 30m 规模)。
@@ -194,16 +211,19 @@ def quick_analyze_pit(pcd_filepath):
         'z_interval': 1.0,           
         'slice_thickness': 0.30,     
         'ransac_iterations': 5000,
-        'ransac_threshold': 0.2
+        'ransac_threshold': 0.2,
+        'radius_range': (0.2, 6.0),  # 先验半径范围 (R_min, R_max)，用于 RANSAC 假设预筛
+        'voxel_size': 0.02           # 分析前体素下采样边长，0 表示不下采样
     }
     
     print("--- 正在使用内置参数进行分析 ---")
     
     return calculate_pit_pipeline(pcd_filepath, CROP_PARAMS, ANALYSIS_PARAMS)
 
-def calculate_pit_pipeline_pcd_data(pcd: o3d.geometry.PointCloud, crop_params, analysis_params):
+def calculate_pit_pipeline_pcd_data(pcd, crop_params, analysis_params):
     """
     整个基坑分析流程的入口函数。
+    pcd 可以是 o3d.geometry.PointCloud 或 o3d.t.geometry.PointCloud，返回的裁剪点云与输入类型相同。
     返回: (metrics, cropped_pcd) 元组，如果失败则返回 (None, None)
     """
     # --- 裁剪参数 (默认值，您可以根据实际需求调整) ---
@@ -218,7 +238,9 @@ def calculate_pit_pipeline_pcd_data(pcd: o3d.geometry.PointCloud, crop_params, a
         'z_interval': 1.0,
         'slice_thickness': 0.30,
         'ransac_iterations': 5000,
-        'ransac_threshold': 0.2
+        'ransac_threshold': 0.2,
+        'radius_range': (0.2, 6.0),  # 先验半径范围 (R_min, R_max)，用于 RANSAC 假设预筛
+        'voxel_size': 0.02           # 分析前体素下采样边长，0 表示不下采样
     }
 
     # 使用三目运算符选择裁剪参数
@@ -230,7 +252,7 @@ def calculate_pit_pipeline_pcd_data(pcd: o3d.geometry.PointCloud, crop_params, a
     try:
         print(f"1. 尝试加载原始数据")
         pcd_original = pcd
-        if not pcd_original.has_points():
+        if point_count(pcd_original) == 0:
             raise FileNotFoundError("错误: PCD 文件加载失败或不含点。")
 
         # 步骤 A: 裁剪
@@ -240,9 +262,12 @@ def calculate_pit_pipeline_pcd_data(pcd: o3d.geometry.PointCloud, crop_params, a
         if pcd_cropped is None:
             raise ValueError("流程中止：裁剪后点云为空。请检查 CROP_PARAMS。")
 
-        # 步骤 B: 分析
+        # 步骤 B: 体素下采样 (仅用于分析，返回给界面显示的仍是完整的裁剪点云)
+        pcd_analysis = voxel_downsample(pcd_cropped, analysis_params.get('voxel_size', DEFAULT_VOXEL_SIZE))
+
+        # 步骤 C: 分析
         print("\n================== 开始基坑分析 ==================")
-        metrics = analyze_and_calculate_metrics(pcd_cropped, analysis_params)
+        metrics = analyze_and_calculate_metrics(pcd_analysis, analysis_params)
 
         # 返回 metrics 和裁剪后的点云
         return metrics, pcd_cropped
@@ -293,7 +318,7 @@ if __name__ == '__main__':
 
 #类别,要求,说明
 #Python 版本,3.6 或更高,由于使用了 open3d 和现代 Python 语法，建议使用 Python 3.6 ~ 3.12 版本区间。
-#依赖库,numpy,用于高效的数值计算和数组操作。open3d,用于 PCD 文件的导入、点云对象操作（裁剪）和点云处理。random,用于 RANSAC 算法中的随机采样。os,用于操作系统路径处理。
+#依赖库,numpy,用于高效的数值计算和数组操作。open3d,用于 PCD 文件的导入、点云对象操作（裁剪）和点云处理。os,用于操作系统路径处理。circle_fit,共用的切片圆拟合 (Kåsa + RANSAC 兜底)；其 RANSAC 可选使用 numba JIT 内核，或由 tools/build.py --kernel 编译的 Cython/AVX2 内核 (ransac_kernel，优先于 numba)。
 
 
 #算法总览与执行流程
@@ -303,6 +328,8 @@ if __name__ == '__main__':
 
 #裁剪预处理：调用 crop_pcd_by_bbox 函数，使用 CROP_PARAMS 中定义的边界框裁剪点云。
 
+#体素下采样：调用 voxel_downsample 函数，按 ANALYSIS_PARAMS['voxel_size'] 对裁剪后的点云下采样，仅用于分析。
+
 #核心分析：将裁剪后的点云对象传递给 analyze_pit_pcd_object 函数，使用 ANALYSIS_PARAMS 进行深度分层和圆拟合。
 
 #结果输出：打印坑深、平均半径、最大半径和详细的分层拟合结果。
@@ -315,8 +342,10 @@ if __name__ == '__main__':
 #ANALYSIS_PARAMS中参数名,所在位置,类型,示例值,说明
 #"z_interval",ANALYSIS_PARAMS,float,"1.0",切片间隔，单位为米。
 #"slice_thickness",ANALYSIS_PARAMS,float,"0.30",切片厚度，单位为米。
-#"ransac_iterations",ANALYSIS_PARAMS,int,"5000",RANSAC 迭代次数。
+#"ransac_iterations",ANALYSIS_PARAMS,int,"5000",RANSAC 迭代次数 (仅在 Kåsa 拟合内点不足时兜底使用)。
 #"ransac_threshold",ANALYSIS_PARAMS,float,"0.2",点到圆周的最大距离，用于判定内点。
+#"radius_range",ANALYSIS_PARAMS,tuple,"(0.2, 6.0)",先验半径范围 (R_min, R_max)，单位为米；RANSAC 只统计半径在此范围内、圆心在切片范围外扩 R_max 内的假设。缺省时不预筛。
+#"voxel_size",ANALYSIS_PARAMS,float,"0.02",分析前体素下采样边长，单位为米；0 表示不下采样。越大越快，但切片点数与深度分辨率降低。
 
 #返回值,类型,说明
 #1,float,pit_depth (总坑深)：点云中 Z 坐标的第 99.5 百分位值，代表基坑的最大有效深度。
@@ -0,0 +1,143 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+"""
+RANSAC 圆拟合的 Cython/AVX2 内核。
+
+与 circle_fit 中 numba 内核 _ransac_njit 接口一致：run(xs, ys, threshold, seeds, bounds)。
+内点统计每次处理 8 个 float32 点：FMA 求平方距离，cmp + movemask + popcount 计数。
+
+编译 (需 Cython 与 C 编译器，产物就地放在 src/algo 下):
+    python tools/build.py --kernel
+"""
+
+from libc.math cimport ceil, log, sqrt
+
+# 模块整体不加 ISA 编译选项 (否则模块初始化代码也会用到 VEX 指令，无 AVX 的 CPU 在
+# cpu_supported() 之前就 SIGILL)；只有内点统计函数通过 target 属性启用 AVX2/FMA。
+# MSVC 无需 /arch 即可生成这些 intrinsics。
+cdef extern from *:
+    """
+    #include <immintrin.h>
+    #if defined(_MSC_VER)
+    #include <intrin.h>
+    #define RK_TARGET_AVX2
+    #define RK_POPCOUNT(x) ((int)__popcnt((unsigned int)(x)))
+    static int rk_cpu_supported(void) {
+        int info[4];
+        __cpuid(info, 0);
+        if (info[0] < 7) return 0;
+        __cpuid(info, 1);
+        if (!((info[2] >> 12) & 1) || !((info[2] >> 27) & 1) || !((info[2] >> 28) & 1)) return 0;
+        if ((_xgetbv(0) & 6) != 6) return 0;
+        __cpuidex(info, 7, 0);
+        return (info[1] >> 5) & 1;
+    }
+    #else
+    #define RK_TARGET_AVX2 __attribute__((target("avx2,fma,popcnt")))
+    #define RK_POPCOUNT(x) __builtin_popcount((unsigned int)(x))
+    static int rk_cpu_supported(void) {
+        __builtin_cpu_init();
+        return __builtin_cpu_supports("avx2") && __builtin_cpu_supports("fma");
+    }
+    #endif
+
+    /* 统计落在 (r - thr)^2 < d^2 < (r + thr)^2 环带内的点数，每次处理 8 个点 */
+    RK_TARGET_AVX2
+    static int rk_ransac_count(const float* xs, const float* ys, int n,
+                               float cx, float cy, float r, float thr) {
+        float lo_sq = r > thr ? (r - thr) * (r - thr) : -1.0f;
+        float hi_sq = (r + thr) * (r + thr);
+        __m256 cx_vec = _mm256_set1_ps(cx);
+        __m256 cy_vec = _mm256_set1_ps(cy);
+        __m256 lo_vec = _mm256_set1_ps(lo_sq);
+        __m256 hi_vec = _mm256_set1_ps(hi_sq);
+        int count = 0;
+        int i = 0;
+        for (; i + 8 <= n; i += 8) {
+            __m256 dx = _mm256_sub_ps(_mm256_loadu_ps(xs + i), cx_vec);
+            __m256 dy = _mm256_sub_ps(_mm256_loadu_ps(ys + i), cy_vec);
+            __m256 d2 = _mm256_fmadd_ps(dy, dy, _mm256_mul_ps(dx, dx));
+            __m256 mask = _mm256_and_ps(_mm256_cmp_ps(d2, lo_vec, _CMP_GT_OQ),
+                                        _mm256_cmp_ps(d2, hi_vec, _CMP_LT_OQ));
+            count += RK_POPCOUNT(_mm256_movemask_ps(mask));
+        }
+        for (; i < n; ++i) {
+            float sx = xs[i] - cx;
+            float sy = ys[i] - cy;
+            float sd2 = sx * sx + sy * sy;
+            if (sd2 > lo_sq && sd2 < hi_sq) count += 1;
+        }
+        return count;
+    }
+    """
+    int rk_cpu_supported() nogil
+    int rk_ransac_count(const float* xs, const float* ys, int n,
+                        float cx, float cy, float r, float thr) nogil
+
+# 与 circle_fit.RANSAC_CONFIDENCE 保持一致
+cdef double RANSAC_CONFIDENCE = 0.999
+
+
+def cpu_supported():
+    """当前 CPU 是否支持 AVX2 + FMA；不支持时调用方应退回其它实现。"""
+    return bool(rk_cpu_supported())
+
+
+cdef inline bint fit3(double x1, double y1, double x2, double y2, double x3, double y3,
+                      double* cx, double* cy, double* r_sq) noexcept nogil:
+    """三点拟合圆，输出半径平方；开方留给通过预筛的假设。"""
+    cdef double temp = x2 * x2 + y2 * y2
+    cdef double bc = (x1 * x1 + y1 * y1 - temp) / 2
+    cdef double cd = (temp - x3 * x3 - y3 * y3) / 2
+    cdef double det = (x1 - x2) * (y2 - y3) - (x2 - x3) * (y1 - y2)
+    if det < 1.0e-6 and det > -1.0e-6:
+        return False
+    cx[0] = (bc * (y2 - y3) - cd * (y1 - y2)) / det
+    cy[0] = (cd * (x1 - x2) - bc * (x2 - x3)) / det
+    r_sq[0] = (x1 - cx[0]) ** 2 + (y1 - cy[0]) ** 2
+    return 1.0e-12 <= r_sq[0] <= 1.0e10
+
+
+def run(const float[::1] xs, const float[::1] ys, double threshold,
+        const int[:, ::1] seeds, tuple bounds):
+    """
+    依次评估 seeds 中的假设，按自适应规则提前终止；bounds 为 (x_lo, x_hi, y_lo, y_hi, radius_min, radius_max)。
+    返回 (best_count, center_x, center_y, radius)。
+    """
+    cdef double x_lo = bounds[0], x_hi = bounds[1], y_lo = bounds[2], y_hi = bounds[3]
+    cdef double radius_min = bounds[4], radius_max = bounds[5]
+    cdef double radius_min_sq = radius_min * radius_min
+    cdef double radius_max_sq = radius_max * radius_max
+    cdef int n = xs.shape[0]
+    cdef Py_ssize_t iterations = seeds.shape[0]
+    cdef Py_ssize_t required = iterations
+    cdef Py_ssize_t i = 0
+    cdef int a, b, c, count
+    cdef int best_count = 0
+    cdef double cx = 0.0, cy = 0.0, r_sq = 0.0, r
+    cdef double best_cx = 0.0, best_cy = 0.0, best_r = 0.0
+    cdef double w, needed
+    if n == 0:
+        return 0, 0.0, 0.0, 0.0
+    with nogil:
+        while i < required:
+            a = seeds[i, 0]
+            b = seeds[i, 1]
+            c = seeds[i, 2]
+            i += 1
+            if not fit3(xs[a], ys[a], xs[b], ys[b], xs[c], ys[c], &cx, &cy, &r_sq):
+                continue
+            if (cx < x_lo or cx > x_hi or cy < y_lo or cy > y_hi
+                    or r_sq < radius_min_sq or r_sq > radius_max_sq):
+                continue
+            r = sqrt(r_sq)
+            count = rk_ransac_count(&xs[0], &ys[0], n, <float>cx, <float>cy, <float>r, <float>threshold)
+            if count > best_count:
+                best_count = count
+                best_cx = cx
+                best_cy = cy
+                best_r = r
+                w = <double>best_count / n
+                needed = ceil(log(1 - RANSAC_CONFIDENCE) / log(max(1 - w * w * w, 1.0e-12)))
+                if needed < required:
+                    required = <Py_ssize_t>needed
+    return best_count, best_cx, best_cy, best_r
@@ -1,6 +1,11 @@
 import logging
+import logging.handlers
 import os
 import sys
+import threading
+
+# 保护单例的首次创建：切片拟合线程可能同时首次调用 get_logger()
+_init_lock = threading.Lock()
 
 
 class LogManager:
@@ -11,8 +16,11 @@ class LogManager:
     
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._logger = cls._setup_logging()
+            with _init_lock:
+                # 加锁后再检查一次，避免重复配置处理器；先配置好 _logger 再发布 _instance
+                if cls._instance is None:
+                    cls._logger = cls._setup_logging()
+                    cls._instance = super().__new__(cls)
         return cls._instance
     
     @staticmethod
@@ -45,6 +53,13 @@ class LogManager:
         file_handler = logging.FileHandler(log_file, encoding='utf-8')
         file_handler.setLevel(logging.DEBUG)
 
+        # 文件写入经内存缓冲：攒满 64 条或遇到 WARNING 及以上即落盘，减少逐条写入的系统调用；
+        # 缓冲小，异常退出时最多丢失几十条 DEBUG/INFO。正常退出时由 logging.shutdown 关闭并刷出
+        memory_handler = logging.handlers.MemoryHandler(
+            capacity=64, flushLevel=logging.WARNING, target=file_handler
+        )
+        memory_handler.setLevel(logging.DEBUG)
+
         # 创建控制台处理器
         console_handler = logging.StreamHandler()
         console_handler.setLevel(logging.INFO)
@@ -57,7 +72,7 @@ class LogManager:
         console_handler.setFormatter(formatter)
 
         # 添加处理器到记录器
-        logger.addHandler(file_handler)
+        logger.addHandler(memory_handler)
         logger.addHandler(console_handler)
 
         return logger
@@ -70,21 +85,21 @@ class LogManager:
         return cls._logger
     
     @classmethod
-    def debug(cls, message):
-        """记录debug级别日志"""
-        cls.get_logger().debug(message)
+    def debug(cls, message, *args, **kwargs):
+        """记录debug级别日志，args 按 %-格式延迟到实际输出时才格式化"""
+        cls.get_logger().debug(message, *args, **kwargs)
     
     @classmethod
-    def info(cls, message):
-        """记录info级别日志"""
-        cls.get_logger().info(message)
+    def info(cls, message, *args, **kwargs):
+        """记录info级别日志，args 按 %-格式延迟到实际输出时才格式化"""
+        cls.get_logger().info(message, *args, **kwargs)
     
     @classmethod
-    def warning(cls, message):
-        """记录warning级别日志"""
-        cls.get_logger().warning(message)
+    def warning(cls, message, *args, **kwargs):
+        """记录warning级别日志，args 按 %-格式延迟到实际输出时才格式化"""
+        cls.get_logger().warning(message, *args, **kwargs)
     
     @classmethod
-    def error(cls, message):
-        """记录error级别日志"""
-        cls.get_logger().error(message)
+    def error(cls, message, *args, **kwargs):
+        """记录error级别日志，args 按 %-格式延迟到实际输出时才格式化"""
+        cls.get_logger().error(message, *args, **kwargs)
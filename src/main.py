@@ -733,10 +733,13 @@ class AppWindow:
                 'z_interval': 1.0,
                 'slice_thickness': 0.30,
                 'ransac_iterations': 5000,
-                'ransac_threshold': 0.2
+                'ransac_threshold': 0.2,
+                'radius_range': (0.2, 6.0),
+                'voxel_size': 0.02
             }
 
-            metrics, cropped_pcd = analysis.calculate_pit_pipeline_pcd_data(self._geometry.to_legacy(), crop_params, analysis_params)
+            # 直接传入 tensor 点云，省去 to_legacy() 的整云 float64 拷贝
+            metrics, cropped_pcd = analysis.calculate_pit_pipeline_pcd_data(self._geometry, crop_params, analysis_params)
 
             # 在主线程中更新UI和显示裁剪后的点云
             def update_ui():
@@ -747,11 +750,11 @@ class AppWindow:
                         verticality_status = "Fail"
 
                     logger.info("\n================== 最终计算结果 ==================")
-                    logger.info(f"**总 坑 深 (Depth): {metrics.depth:.3f} 米**")
-                    logger.info(f"**基坑 平均直径 (Avg. D): {metrics.avg_diameter:.3f} 米**")
+                    logger.info("**总 坑 深 (Depth): %.3f 米**", metrics.depth)
+                    logger.info("**基坑 平均直径 (Avg. D): %.3f 米**", metrics.avg_diameter)
                     logger.info("--- 垂直度校验 ---")
-                    logger.info(f"**基坑 垂直度误差: {metrics.verticality_deg:.3f} 度 (0° 为完美垂直)**")
-                    logger.info(f"**基坑合格情况: {verticality_status}**")
+                    logger.info("**基坑 垂直度误差: %.3f 度 (0° 为完美垂直)**", metrics.verticality_deg)
+                    logger.info("**基坑合格情况: %s**", verticality_status)
 
                     self._update_result_labels(
                         f"{metrics.depth:.3f} m",
@@ -761,8 +764,10 @@ class AppWindow:
                     
                     # 只有在计算成功时才显示裁剪后的点云
                     if cropped_pcd is not None:
-                        # 将 legacy 点云转换为 tensor 点云
-                        cropped_tensor_pcd = o3d.t.geometry.PointCloud.from_legacy(cropped_pcd)
+                        # 裁剪结果与输入同为 tensor 点云；legacy 输入时才需转换
+                        cropped_tensor_pcd = cropped_pcd
+                        if not isinstance(cropped_pcd, o3d.t.geometry.PointCloud):
+                            cropped_tensor_pcd = o3d.t.geometry.PointCloud.from_legacy(cropped_pcd)
                         # 清空场景并添加裁剪后的点云
                         self._scene.scene.clear_geometry()
                         self._geometry = cropped_tensor_pcd
@@ -814,7 +819,7 @@ class AppWindow:
                     o3d.io.write_point_cloud(filename, geometry)
                 # 可以添加更多格式支持
         except Exception as e:
-            logger.error(f"导出点云失败: {e}")
+            logger.error("导出点云失败: %s", e)
 
     def _on_menu_export(self):
         dlg = gui.FileDialog(gui.FileDialog.SAVE, "Choose file to save",
@@ -888,7 +893,7 @@ class AppWindow:
             if geometry_type & o3d.io.CONTAINS_TRIANGLES:
                 mesh = o3d.io.read_triangle_model(path)
             if mesh is None:
-                logger.info( path, "appears to be a point cloud")
+                logger.info("%s appears to be a point cloud", path)
                 cloud = None
                 try:
                     cloud = o3d.t.io.read_point_cloud(path)
@@ -897,7 +902,7 @@ class AppWindow:
 
 
                 if cloud is not None:
-                    logger.info("Successfully read", path)
+                    logger.info("Successfully read %s", path)
 
                     # ====== 关键：安全判断 intensity 是否存在 ======
 
@@ -917,11 +922,11 @@ class AppWindow:
 
                             cloud.point.colors = o3d.core.Tensor(colors, dtype=o3d.core.float32)
                         except Exception as e:
-                            logger.error("Failed to convert intensity to colors",e)
+                            logger.error("Failed to convert intensity to colors: %s", e)
 
                     geometry = cloud
                 else:
-                    logger.warn("Failed to read points", path)
+                    logger.warning("Failed to read points %s", path)
 
             if geometry is not None or mesh is not None:
                 try:
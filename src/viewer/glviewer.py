@@ -1,131 +1,775 @@
 
+import ctypes
+import os
 import sys
+import threading
+import time
+from ctypes import wintypes
 
-import open3d as o3d
+import numpy as np
+import win32event
 import win32gui
-from PySide6.QtCore import Qt
+import win32process
+from PySide6.QtCore import Qt, QThread, QTimer, Signal
 from PySide6.QtGui import QSurfaceFormat, QAction
 from PySide6.QtWidgets import (
     QMainWindow, QFileDialog, QVBoxLayout,
     QWidget, QMessageBox, QLabel
 )
-from open3d.visualization import gui
 from core.log_manager import LogManager as logger
 
+# open3d 导入耗时较长，改为在后台线程中预加载，使用前调用 _wait_for_o3d()
+o3d = None
+gui = None
+rendering = None
+_o3d_ready = threading.Event()
+_o3d_error = None
+_o3d_thread = None
+_o3d_lock = threading.Lock()
+
+
+def _import_o3d():
+    global o3d, gui, rendering, _o3d_error
+    try:
+        import open3d
+        from open3d.visualization import gui as o3d_gui, rendering as o3d_rendering
+        o3d, gui, rendering = open3d, o3d_gui, o3d_rendering
+    except Exception as e:
+        _o3d_error = e
+    finally:
+        _o3d_ready.set()
+
+
+def preload_open3d():
+    """在后台线程中开始导入 open3d（重复调用只启动一次），应在创建 QApplication 后尽早调用"""
+    global _o3d_thread
+    with _o3d_lock:
+        if _o3d_thread is None:
+            _o3d_thread = threading.Thread(target=_import_o3d, daemon=True)
+            _o3d_thread.start()
+
+
+def _wait_for_o3d():
+    """等待 open3d 导入完成；尚未开始预加载时在此启动，导入失败时重新抛出异常"""
+    preload_open3d()
+    _o3d_ready.wait()
+    if _o3d_error is not None:
+        raise _o3d_error
+
+
+def _set_default_surface_format():
+    """设置 OpenGL（提升兼容性）；须在 QApplication 与任何控件创建之前生效"""
+    fmt = QSurfaceFormat()
+    fmt.setVersion(3, 3)
+    fmt.setProfile(QSurfaceFormat.OpenGLContextProfile.CoreProfile)
+    fmt.setDepthBufferSize(24)
+    QSurfaceFormat.setDefaultFormat(fmt)
+
+
+# 导入本模块时即设置默认格式
+_set_default_surface_format()
+
+# 渲染点数上限：超过时先体素下采样再上传 GPU，保持交互帧率
+MAX_RENDER_POINTS = 5_000_000
+# 分块渲染：每块目标点数；总点数超过 2 倍时才分块，各块独立注册以便视锥剔除
+CHUNK_POINTS = 100_000
+# 相机轮询间隔 (毫秒)，相机变化时重新计算各块可见性
+FRUSTUM_POLL_MS = 100
+# 渐进上传：每 16ms (约一帧) 注册的块数，约 20 万点
+UPLOAD_TICK_MS = 16
+CHUNKS_PER_TICK = 2
+# 分块时一并重排的点属性
+_CHUNK_ATTRIBUTES = ("positions", "colors", "normals", "intensity")
+
+
+def _partition_into_chunks(positions, chunk_points=CHUNK_POINTS):
+    """
+    按均匀网格把点划分成块，返回 (order, starts, mins, maxs)：
+    positions[order] 中每块是连续区间 [starts[i], starts[i+1])，mins/maxs 为各块 AABB (K, 3)。
+    网格边长先按体积均分估计；扫描点云多为表面，块数超过目标 4 倍时按面密度放大一次。
+    """
+    origin = positions.min(axis=0)
+    extent = positions.max(axis=0) - origin
+    extent = np.maximum(extent, extent.max() * 1e-3)
+    n = positions.shape[0]
+    cell = (extent.prod() * chunk_points / n) ** (1 / 3)
+    for attempt in range(2):
+        dims = np.maximum(np.ceil(extent / cell).astype(np.int64), 1)
+        ijk = np.minimum(((positions - origin) / cell).astype(np.int64), dims - 1)
+        keys = (ijk[:, 0] * dims[1] + ijk[:, 1]) * dims[2] + ijk[:, 2]
+        occupied = np.unique(keys).size
+        if attempt or occupied <= 4 * n / chunk_points:
+            break
+        cell *= (occupied * chunk_points / n) ** 0.5
+    order = np.argsort(keys, kind='stable')
+    _, starts = np.unique(keys[order], return_index=True)
+    sorted_positions = positions[order]
+    mins = np.minimum.reduceat(sorted_positions, starts, axis=0)
+    maxs = np.maximum.reduceat(sorted_positions, starts, axis=0)
+    return order, starts, mins, maxs
+
+
+def _frustum_planes(view_matrix, projection_matrix):
+    """从 P·V 矩阵按行组合提取 6 个视锥平面 (6, 4)，平面内侧满足 n·p + d >= 0"""
+    m = np.asarray(projection_matrix, dtype=np.float64) @ np.asarray(view_matrix, dtype=np.float64)
+    return np.stack([m[3] + m[0], m[3] - m[0], m[3] + m[1], m[3] - m[1], m[3] + m[2], m[3] - m[2]])
+
+
+def _boxes_in_frustum(planes, mins, maxs):
+    """
+    AABB 与视锥的保守相交测试 (K,)：对每个平面取法线方向最远的顶点 (p-vertex)，
+    只要有一个平面的 p-vertex 在外侧，该盒子就完全不可见。
+    """
+    normals, offsets = planes[:, :3], planes[:, 3]
+    # (6, K, 3)：按法线分量符号在 min/max 之间选取 p-vertex
+    p_vertex = np.where(normals[:, None, :] >= 0, maxs[None, :, :], mins[None, :, :])
+    distances = np.einsum('pkc,pc->pk', p_vertex, normals) + offsets[:, None]
+    return (distances >= 0).all(axis=0)
+
+
+# 已被某个 PointCloudWidget 嵌入的 GLFW 窗口句柄
+_claimed_glfw_hwnds = set()
+
+
+def _find_glfw_hwnd(pid):
+    """
+    一次 EnumWindows 遍历所有顶层窗口，按类名 GLFW30 与所属进程 PID 同时匹配，
+    返回第一个尚未被其它控件嵌入的句柄；找不到时返回 0。
+    EnumWindows 按 Z 序而非创建顺序返回窗口，因此靠排除已嵌入的句柄来区分，而不是取最后一个。
+    """
+    hits = []
+
+    def callback(hwnd, _):
+        _, window_pid = win32process.GetWindowThreadProcessId(hwnd)
+        if window_pid == pid and hwnd not in _claimed_glfw_hwnds and win32gui.GetClassName(hwnd) == 'GLFW30':
+            hits.append(hwnd)
+        return True
+
+    win32gui.EnumWindows(callback, None)
+    return hits[0] if hits else 0
+
+
+# WinEvent 钩子常量 (winuser.h)
+EVENT_OBJECT_CREATE = 0x8000
+WINEVENT_OUTOFCONTEXT = 0x0000
+OBJID_WINDOW = 0
+# 等待 GLFW 窗口创建的超时 (毫秒)，超时后退回 EnumWindows 查找
+GLFW_WINDOW_TIMEOUT_MS = 2000
+
+
+class _GlfwWindowWatcher:
+    """
+    监听本进程的 EVENT_OBJECT_CREATE，GLFW 窗口 (类名 GLFW30) 一创建即记录句柄。
+    须在创建 O3DVisualizer 之前 start()；钩子为 out-of-context，回调经本线程的消息队列派发，
+    因此 wait() 在等待期间派发消息，而不是阻塞在 Event 上 (否则回调永远不会执行)。
+    """
+
+    def __init__(self):
+        self.hwnd = 0
+        self._hook = None
+        self._callback = None  # 持有 ctypes 回调引用，卸载钩子前不能被回收
+
+    def start(self):
+        proc_type = ctypes.WINFUNCTYPE(
+            None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND,
+            wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD
+        )
+
+        def on_event(hook, event, hwnd, id_object, id_child, thread_id, event_time):
+            if self.hwnd or not hwnd or id_object != OBJID_WINDOW:
+                return
+            try:
+                if win32gui.GetClassName(hwnd) == 'GLFW30':
+                    self.hwnd = hwnd
+            except Exception:
+                pass  # 窗口可能已被销毁
+
+        self._callback = proc_type(on_event)
+        user32 = ctypes.windll.user32
+        user32.SetWinEventHook.restype = wintypes.HANDLE
+        self._hook = user32.SetWinEventHook(
+            EVENT_OBJECT_CREATE, EVENT_OBJECT_CREATE, 0, self._callback,
+            os.getpid(), 0, WINEVENT_OUTOFCONTEXT
+        )
+
+    def wait(self, timeout_ms=GLFW_WINDOW_TIMEOUT_MS):
+        """派发消息直到拿到句柄或超时；MsgWaitForMultipleObjects 在消息到达前阻塞，不做定时轮询"""
+        deadline = time.monotonic() + timeout_ms / 1000
+        win32gui.PumpWaitingMessages()
+        while not self.hwnd:
+            remaining = int((deadline - time.monotonic()) * 1000)
+            if remaining <= 0:
+                break
+            win32event.MsgWaitForMultipleObjects([], False, remaining, win32event.QS_ALLINPUT)
+            win32gui.PumpWaitingMessages()
+        return self.hwnd
+
+    def stop(self):
+        if self._hook:
+            ctypes.windll.user32.UnhookWinEvent(self._hook)
+            self._hook = None
+        self._callback = None
+
+
+# uint8 颜色归一化系数：float32 标量相乘，numpy 单遍向量化完成，不经 float64 中转
+_COLOR_SCALE = np.float32(1.0 / 255.0)
+
+# PLY 标量属性类型 -> numpy 类型 (字节序另行拼接)
+_PLY_DTYPES = {
+    'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8',
+}
+
+
+def _fast_read_pointcloud(path):
+    """
+    二进制 PLY 快速读取：手动解析文件头得到顶点记录的结构化 dtype，
+    再用 np.memmap 直接映射顶点数据，不经过逐点解析。
+    x/y/z、nx/ny/nz、颜色分别映射为 positions、normals、colors，其余标量属性按原名保留。
+    仅支持 vertex 为第一个 element 且不含 list 属性的二进制 PLY，其余情况返回 None，
+    由调用方退回 Open3D 通用读取器。
+    """
+    if not path.lower().endswith('.ply'):
+        return None
+    with open(path, 'rb') as f:
+        if f.readline().strip() != b'ply':
+            return None
+        byte_order = None
+        elements = []  # [(name, count, [(prop_name, dtype) | None])]
+        while True:
+            line = f.readline()
+            if not line:
+                return None
+            tokens = line.split()
+            if not tokens or tokens[0] in (b'comment', b'obj_info'):
+                continue
+            if tokens[0] == b'end_header':
+                break
+            if tokens[0] == b'format':
+                byte_order = {b'binary_little_endian': '<', b'binary_big_endian': '>'}.get(tokens[1])
+                if byte_order is None:
+                    return None  # ASCII PLY 交给通用读取器
+            elif tokens[0] == b'element':
+                elements.append((tokens[1].decode(), int(tokens[2]), []))
+            elif tokens[0] == b'property' and elements:
+                if tokens[1] == b'list':
+                    elements[-1][2].append(None)
+                else:
+                    np_type = _PLY_DTYPES.get(tokens[1].decode())
+                    if np_type is None:
+                        return None
+                    elements[-1][2].append((tokens[2].decode(), np_type))
+        header_len = f.tell()
+
+    if byte_order is None or not elements or elements[0][0] != 'vertex':
+        return None
+    _, n_vertices, props = elements[0]
+    if n_vertices == 0 or None in props:
+        return None
+    dtype = np.dtype([(name, byte_order + np_type) for name, np_type in props])
+    names = dtype.names
+    if not {'x', 'y', 'z'} <= set(names):
+        return None
+
+    try:
+        vertices = np.memmap(path, dtype=dtype, mode='r', offset=header_len, shape=(n_vertices,))
+    except ValueError:
+        return None  # 文件被截断，交给通用读取器报错或容错
+
+    def stack_fields(fields):
+        out = np.empty((n_vertices, len(fields)), dtype=np.float32)
+        for k, field in enumerate(fields):
+            out[:, k] = vertices[field]
+        return out
+
+    pcd = o3d.t.geometry.PointCloud(o3d.core.Tensor.from_numpy(stack_fields(('x', 'y', 'z'))))
+    mapped = {'x', 'y', 'z'}
+    if {'nx', 'ny', 'nz'} <= set(names):
+        pcd.point.normals = o3d.core.Tensor.from_numpy(stack_fields(('nx', 'ny', 'nz')))
+        mapped |= {'nx', 'ny', 'nz'}
+    color_names = next((c for c in (('red', 'green', 'blue'), ('r', 'g', 'b')) if set(c) <= set(names)), None)
+    if color_names is not None:
+        colors = stack_fields(color_names)
+        if dtype[color_names[0]].kind in 'iu':
+            colors *= _COLOR_SCALE
+        pcd.point.colors = o3d.core.Tensor.from_numpy(colors)
+        mapped |= set(color_names)
+    # 其余标量属性 (如 intensity) 按原类型保留为 (N, 1)，与通用读取器一致，不丢数据
+    for name in names:
+        if name not in mapped:
+            values = np.ascontiguousarray(vertices[name], dtype=dtype[name].newbyteorder('='))
+            pcd.point[name] = o3d.core.Tensor.from_numpy(values.reshape(-1, 1))
+    return pcd
+
+
+class _PointCloudLoader(QThread):
+    """在后台线程中读取并准备点云，结果通过信号回到 UI 线程"""
+    loaded = Signal(int, object)
+    failed = Signal(int, str)
+
+    def __init__(self, widget, file_path, generation, device):
+        super().__init__(widget)
+        self._widget = widget
+        self._file_path = file_path
+        self._generation = generation
+        self._device = device
+
+    def run(self):
+        try:
+            result = self._widget._prepare_point_cloud(
+                self._file_path, self._device, self.isInterruptionRequested
+            )
+        except Exception as e:
+            logger.error("加载点云失败: %s", e)
+            self.failed.emit(self._generation, str(e))
+            return
+        if result is not None:
+            self.loaded.emit(self._generation, result)
+
+
 class PointCloudWidget(QWidget):
+    """
+    嵌入 Open3D 可视化器的点云控件。
+    dtype 约定：控件持有的 tensor 点云 (self._pcd / self._pcd_full / 各分块) 的
+    positions、normals、colors 一律为 float32，colors 取值 [0, 1]；
+    下采样、分块、导出等后续处理都应保持 float32，避免渲染上传时的类型转换与双倍带宽。
+    设备约定：这些点云都在 CPU 上 (Filament 从主机内存上传顶点缓冲)，CUDA 只用于渲染下采样的计算。
+    """
+    load_failed = Signal(str)
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setLayout(QVBoxLayout())
         self.layout().setContentsMargins(0, 0, 0, 0)
 
         self.vis = None
+        self._pcd = None  # 当前显示的 tensor 点云 (可能已下采样)，用于判断能否原地更新
+        self._pcd_full = None  # 完整分辨率点云，供保存/导出使用
+        self._device = None  # 渲染下采样的计算设备，首次加载时在 UI 线程上确定一次
+        # 分块渲染状态：块名、各块 AABB、当前可见性，以及上次用于剔除的相机矩阵
+        self._chunk_names = []
+        self._chunk_mins = None
+        self._chunk_maxs = None
+        self._chunk_visible = None
+        self._chunk_layout = None  # 各块 (点数, 是否有颜色)，布局不变时重新加载可原地更新
+        self._last_view = None
+        self._frustum_timer = QTimer(self)
+        self._frustum_timer.setInterval(FRUSTUM_POLL_MS)
+        self._frustum_timer.timeout.connect(self._update_chunk_visibility)
+        # 渐进上传状态：待注册的块队列，以及全部注册后是否重置相机
+        self._pending_chunks = []
+        self._reset_camera_pending = False
+        # 原地更新绕过了 Open3DScene 的包围盒记录，此时由控件记录场景 AABB (mins, maxs) 供相机重置使用
+        self._scene_bounds = None
+        self._upload_timer = QTimer(self)
+        self._upload_timer.setInterval(UPLOAD_TICK_MS)
+        self._upload_timer.timeout.connect(self._drain_pending_chunks)
+        # 异步加载：进行中的加载线程，以及用于丢弃过期结果的加载序号
+        self._loaders = set()
+        self._load_generation = 0
+        # 仅首次加载时自动重置相机，之后的重新加载保持当前视角，需要时调用 reset_view()
+        self._first_load = True
+
+        # 设置面板默认隐藏，由该动作切换，避免每次几何体变化都触发面板重新布局
+        self.settings_action = QAction("设置面板", self)
+        self.settings_action.setCheckable(True)
+        self.settings_action.toggled.connect(self.set_settings_visible)
+        self.reset_view_action = QAction("重置视角", self)
+        self.reset_view_action.triggered.connect(self.reset_view)
 
-        # 尝试创建嵌入式可视化器
+        # 可视化器推迟到事件循环开始后创建，主窗口先显示，open3d 同时在后台导入
+        QTimer.singleShot(0, self._init_visualizer)
+
+    def _init_visualizer(self):
+        """等待 open3d 导入完成后尝试创建嵌入式可视化器"""
         try:
+            _wait_for_o3d()
             self._create_embedded_visualizer()
         except Exception as e:
+            logger.error("创建可视化器失败: %s", e)
             self.close()
 
     def _create_embedded_visualizer(self):
-
-        # 创建 O3DVisualizer
-        self.vis = o3d.visualization.O3DVisualizer()
-        self.vis.show(False)
-        self.vis.show_settings = True
-        self.vis.show_menu( True)
-
-
-        # 添加初始几何体
-        self.vis.add_geometry("Coordinate", o3d.geometry.TriangleMesh.create_coordinate_frame(size=0.5))
-        self.vis.reset_camera_to_default()
-
-        # 添加窗口到Application
-        app = gui.Application.instance
-        if app:
-            app.add_window(self.vis)
-
-
-        if sys.platform == "win32":
-            from PySide6.QtGui import QWindow
-            # 注意：PySide6 6.8 中 QWindow.fromWinId 仍然可用，但需确保是整数句柄
-            # 获取原生窗口句柄（仅 Windows 可靠）
-            self.win_id = win32gui.FindWindow('GLFW30', None)
-            logger.info(f"获取窗口句柄成功：{self.win_id}")
-            if isinstance(self.win_id, int):
-                window = QWindow.fromWinId(self.win_id)
-                self.window = window
-            else:
-                raise RuntimeError("native_window 不是有效的窗口句柄 (int)")
-        else:
+        if sys.platform != "win32":
             # macOS/Linux: 不支持可靠嵌入，抛出异常触发 fallback
             raise RuntimeError("macOS/Linux 不支持嵌入 Open3D 窗口")
 
+        # 在 GLFW 窗口创建之前注册钩子，窗口一出现即拿到句柄，无需额外驱动事件循环
+        watcher = _GlfwWindowWatcher()
+        watcher.start()
+        try:
+            # 创建 O3DVisualizer
+            self.vis = o3d.visualization.O3DVisualizer()
+            self.vis.show(False)
+            self.vis.show_settings = False
+            self.vis.show_menu( True)
+
+            # 点云共用的材质只创建一次，添加几何体时显式传入，省去 Filament 逐次推断材质
+            self._material = rendering.MaterialRecord()
+            self._material.shader = "defaultUnlit"
+            self._material.point_size = 2.0
+
+
+            # 添加初始几何体
+            self.vis.add_geometry("Coordinate", o3d.geometry.TriangleMesh.create_coordinate_frame(size=0.5))
+            self.vis.reset_camera_to_default()
+
+            # 添加窗口到Application
+            app = gui.Application.instance
+            if app:
+                app.add_window(self.vis)
+
+            self.win_id = watcher.wait()
+        finally:
+            watcher.stop()
+        if not self.win_id:
+            # 钩子超时未命中时，退回按类名与 PID 枚举本进程的 GLFW 窗口
+            self.win_id = _find_glfw_hwnd(os.getpid())
+
+        from PySide6.QtGui import QWindow
+        # 注意：PySide6 6.8 中 QWindow.fromWinId 仍然可用，但需确保是整数句柄
+        logger.info("获取窗口句柄成功：%s", self.win_id)
+        if isinstance(self.win_id, int) and self.win_id:
+            _claimed_glfw_hwnds.add(self.win_id)
+            window = QWindow.fromWinId(self.win_id)
+            self.window = window
+        else:
+            raise RuntimeError("native_window 不是有效的窗口句柄 (int)")
+
         # 嵌入到 QWidget
         container = QWidget.createWindowContainer(window, self)
+        # 容器作为独立的原生窗口，不走 Qt 的离屏合成路径；祖先控件仍保持非原生
+        container.setAttribute(Qt.WidgetAttribute.WA_NativeWindow, True)
+        container.setAttribute(Qt.WidgetAttribute.WA_DontCreateNativeAncestors, True)
         self.layout().addWidget(container)
 
-    def load_point_cloud(self, file_path):
+    @staticmethod
+    def _select_device():
+        """有可用 CUDA 时渲染下采样在 GPU 上计算，否则留在 CPU"""
         try:
-            pcd = o3d.io.read_point_cloud(file_path)
-            if pcd.is_empty():
-                raise ValueError("点云文件为空")
-
-            if self.vis:
-                # 嵌入模式：更新可视化器
-                if self.vis.scene.has_geometry("PointCloud"):
-                    self.vis.remove_geometry("PointCloud")
-                self.vis.add_geometry("PointCloud", pcd)
-                self.vis.reset_camera_to_default()
+            if o3d.core.cuda.is_available():
+                return o3d.core.Device("CUDA:0")
         except Exception as e:
-            raise e
+            logger.warning("CUDA 检测失败，使用 CPU: %s", e)
+        return o3d.core.Device("CPU:0")
 
-    def closeEvent(self, event):
-        """修复：正确的资源清理和进程退出"""
-        if self.vis:
-            try:
-                self.window.destroy()
-                # 销毁可视化器窗口
-                logger.info("销毁可视化器窗口")
-                self.vis.close()
-                self.vis = None
-            except Exception as e:
-                logger.error(f"销毁可视化器失败: {e}")
-                pass
-        # 退出Open3D应用
+    @staticmethod
+    def _to_device(pcd, device):
+        """
+        将点云拷贝到 device 上做计算 (在加载线程中执行，不修改控件状态)；迁移失败时留在 CPU，
+        UI 线程收到结果后据此把缓存的设备改为 CPU，之后不再尝试 GPU。
+        """
+        if device.get_type() == o3d.core.Device.DeviceType.CPU:
+            return pcd
         try:
-            app = gui.Application.instance
-            if app:
-                logger.info("退出 app")
-                app.quit()
-        except:
-            pass
+            return pcd.to(device)
+        except Exception as e:
+            logger.warning("点云迁移到 %s 失败，回退到 CPU: %s", device, e)
+            return pcd
+
+    @staticmethod
+    def _downsample_for_render(pcd, max_points=MAX_RENDER_POINTS):
+        """
+        点数超过 max_points 时做体素下采样，使渲染点数约为 max_points。
+        初始体素边长按 AABB 体积均分估计；扫描点云多分布在表面上，
+        结果偏离目标时按面密度 (点数 ∝ 1/v²) 修正体素边长再试，最多 3 次。
+        """
+        n = pcd.point.positions.shape[0]
+        if n <= max_points:
+            return pcd
+        extent = pcd.get_axis_aligned_bounding_box().get_extent().cpu().numpy().astype(np.float64)
+        extent = np.maximum(extent, extent.max() * 1e-3)  # 防止平面点云体积为 0
+        voxel_size = (extent.prod() / max_points) ** (1 / 3)
+        pcd_vis = pcd
+        for _ in range(3):
+            pcd_vis = pcd.voxel_down_sample(voxel_size)
+            count = pcd_vis.point.positions.shape[0]
+            if max_points * 0.5 <= count <= max_points * 1.2:
+                break
+            voxel_size *= (count / max_points) ** 0.5
+        logger.info("渲染下采样: %d -> %d 点 (voxel_size=%.4f)", n, pcd_vis.point.positions.shape[0], voxel_size)
+        return pcd_vis
+
+    def _clear_chunks(self):
+        """移除上一次分块注册的所有几何体，并丢弃尚未上传的块"""
+        self._frustum_timer.stop()
+        self._upload_timer.stop()
+        self._pending_chunks = []
+        for name in self._chunk_names:
+            if self.vis.scene.has_geometry(name):
+                self.vis.remove_geometry(name)
+        self._chunk_names = []
+        self._chunk_mins = self._chunk_maxs = self._chunk_visible = None
+        self._chunk_layout = None
+        self._last_view = None
+        self._scene_bounds = None
+
+    @staticmethod
+    def _build_chunks(pcd):
+        """
+        把点云按空间网格重排为连续的块，返回 (chunks, mins, maxs)；
+        每个属性只整体重排一次，块是重排结果的连续切片。
+        """
+        positions = pcd.point.positions
+        order, starts, mins, maxs = _partition_into_chunks(positions.cpu().numpy())
+        index = o3d.core.Tensor(order, device=positions.device)
+        attributes = {key: pcd.point[key][index] for key in _CHUNK_ATTRIBUTES if key in pcd.point}
+        bounds = np.append(starts, order.size)
+        chunks = []
+        for i in range(starts.size):
+            chunk = o3d.t.geometry.PointCloud(positions.device)
+            for key, values in attributes.items():
+                chunk.point[key] = values[int(bounds[i]):int(bounds[i + 1])]
+            chunks.append(chunk)
+        logger.info("分块渲染: %d 点 -> %d 块", order.size, starts.size)
+        return chunks, mins, maxs
+
+    @staticmethod
+    def _ensure_float32(pcd):
+        """按 dtype 约定把 positions/normals/colors 转为 float32 (已是 float32 时不拷贝)"""
+        for key in ("positions", "normals", "colors"):
+            if key not in pcd.point or pcd.point[key].dtype == o3d.core.float32:
+                continue
+            values = pcd.point[key]
+            if key == "colors" and values.dtype == o3d.core.uint8:
+                # uint8 颜色在 numpy 中一次性转为 float32 并归一化到 [0, 1]
+                colors = values.cpu().numpy().astype(np.float32)
+                colors *= _COLOR_SCALE
+                pcd.point[key] = o3d.core.Tensor.from_numpy(colors)
+                continue
+            pcd.point[key] = values.to(o3d.core.float32)
+        return pcd
+
+    def _prepare_point_cloud(self, file_path, device, interrupted):
+        """
+        读取并准备渲染数据，在加载线程中执行 (不触碰可视化器与控件状态)。
+        返回 (完整点云, 渲染点云, 分块结果或 None, 实际计算设备)，点云均在 CPU 上；
+        interrupted() 为真时在阶段之间放弃并返回 None。
+        """
+        pcd = _fast_read_pointcloud(file_path)
+        if pcd is None:
+            pcd = o3d.t.io.read_point_cloud(file_path)
+        if pcd.is_empty():
+            raise ValueError("点云文件为空")
+        if interrupted():
+            return None
+        pcd_full = pcd = self._ensure_float32(pcd)
+        if pcd_full.point.positions.shape[0] > MAX_RENDER_POINTS:
+            # 下采样是计算，可在 CUDA 上做；结果拷回 CPU 再交给渲染 (Filament 从主机内存上传)
+            pcd_compute = self._to_device(pcd_full, device)
+            device = pcd_compute.device
+            pcd = self._downsample_for_render(pcd_compute)
+            if pcd.device != pcd_full.device:
+                pcd = pcd.cpu()
+        if interrupted():
+            return None
+        chunked = None
+        if pcd.point.positions.shape[0] > 2 * CHUNK_POINTS:
+            chunked = self._build_chunks(pcd)
+        return pcd_full, pcd, chunked, device
+
+    def _show_chunked(self, chunks, mins, maxs):
+        """
+        大点云分块显示：块先进入待上传队列，由 16ms 定时器每帧注册 CHUNKS_PER_TICK 块，
+        首批点在一帧内出现，其余逐帧流入，避免一次性上传卡住事件循环；
+        相机变化时按视锥剔除切换各块可见性，视野外的块不参与光栅化。
+        块数与各块点数都不变时 (如重新加载同一文件)，直接原地更新已注册的块。
+        """
+        layout = tuple((chunk.point.positions.shape[0], "colors" in chunk.point) for chunk in chunks)
+        if not self._pending_chunks and self._chunk_names and layout == self._chunk_layout:
+            for name, chunk in zip(self._chunk_names, chunks):
+                self.vis.scene.scene.update_geometry(name, chunk, self._update_flags(chunk))
+            self._chunk_mins, self._chunk_maxs = mins, maxs
+            self._last_view = None  # AABB 已变化，下次轮询强制重新剔除
+            self._scene_bounds = (mins.min(axis=0), maxs.max(axis=0))
+            if self._reset_camera_pending:
+                self._reset_camera_pending = False
+                self._reset_camera()
+            return
+        if self.vis.scene.has_geometry("PointCloud"):
+            self.vis.remove_geometry("PointCloud")
+        self._clear_chunks()
+        self._chunk_layout = layout
+        self._chunk_mins, self._chunk_maxs = mins, maxs
+        self._chunk_visible = np.ones(len(chunks), dtype=bool)
+        self._pending_chunks = chunks[::-1]  # 倒序存放，pop() 按块序号取出
+        self._drain_pending_chunks()
+        self._upload_timer.start()
+        self._frustum_timer.start()
+
+    def _drain_pending_chunks(self):
+        """每次定时器触发注册一小批块；队列清空后停止，并按需重置相机"""
+        for _ in range(CHUNKS_PER_TICK):
+            if not self._pending_chunks:
+                break
+            chunk = self._pending_chunks.pop()
+            index = len(self._chunk_names)
+            name = f"PC_{index}"
+            self.vis.add_geometry(name, chunk, self._material)
+            self._chunk_names.append(name)
+            if not self._chunk_visible[index]:
+                self.vis.show_geometry(name, False)
+        if not self._pending_chunks:
+            self._upload_timer.stop()
+            if self._reset_camera_pending:
+                self._reset_camera_pending = False
+                self._reset_camera()
+
+    def _update_chunk_visibility(self):
+        """相机变化时重新做视锥剔除，只对已注册且可见性发生变化的块调用 show_geometry"""
+        if not self.vis or self._chunk_visible is None:
+            return
+        camera = self.vis.scene.camera
+        view = np.asarray(camera.get_view_matrix())
+        if self._last_view is not None and np.array_equal(view, self._last_view):
+            return
+        self._last_view = view.copy()
+        planes = _frustum_planes(view, camera.get_projection_matrix())
+        visible = _boxes_in_frustum(planes, self._chunk_mins, self._chunk_maxs)
+        changed = np.flatnonzero(visible != self._chunk_visible)
+        for i in changed[changed < len(self._chunk_names)]:
+            self.vis.show_geometry(self._chunk_names[i], bool(visible[i]))
+        self._chunk_visible = visible
 
-        # 接受关闭事件
+    @staticmethod
+    def _update_flags(pcd):
+        """原地更新时需要重新上传的缓冲：顶点，以及存在时的颜色"""
+        flags = rendering.Scene.UPDATE_POINTS_FLAG
+        if "colors" in pcd.point:
+            flags |= rendering.Scene.UPDATE_COLORS_FLAG
+        return flags
+
+    def _can_update_in_place(self, pcd):
+        """点数和颜色属性都不变时，GPU 缓冲区可复用，只需重新上传顶点数据"""
+        old = self._pcd
+        return (
+            old is not None
+            and self.vis.scene.has_geometry("PointCloud")
+            and old.point.positions.shape[0] == pcd.point.positions.shape[0]
+            and ("colors" in old.point) == ("colors" in pcd.point)
+        )
+
+    def _reset_camera(self):
+        """
+        将相机重置到能看到全部几何体的默认视角。
+        有原地更新记录的 _scene_bounds 时按它摆放相机 (与默认视角一致，沿 +Z 看向 AABB 中心)，
+        否则 Open3DScene 的包围盒是准确的，直接交给 reset_camera_to_default。
+        """
+        if self._scene_bounds is None:
+            self.vis.reset_camera_to_default()
+            return
+        mins, maxs = (np.asarray(b, dtype=np.float32) for b in self._scene_bounds)
+        center = (mins + maxs) / 2
+        eye = center.copy()
+        eye[2] = maxs[2] + 1.5 * (maxs - mins).max()
+        self.vis.setup_camera(60.0, center, eye, np.array([0.0, 1.0, 0.0], dtype=np.float32))
+
+    def reset_view(self):
+        """手动将相机重置到能看到全部几何体的默认视角"""
+        if self.vis:
+            self._reset_camera()
+
+    def set_settings_visible(self, visible):
+        """显示/隐藏 Open3D 设置面板"""
+        if self.vis:
+            self.vis.show_settings = visible
+
+    def load_point_cloud(self, file_path, reset_camera=None):
+        """
+        异步加载点云：读取、下采样和分块在 QThread 中完成，不阻塞 UI；
+        结果回到 UI 线程后再交给可视化器，失败时发出 load_failed 信号。
+        reset_camera 为 None 时仅首次加载重置相机，True/False 则强制指定。
+        """
+        # 设备在 UI 线程上确定一次，再交给加载线程
+        _wait_for_o3d()
+        if self._device is None:
+            self._device = self._select_device()
+        self._load_generation += 1
+        loader = _PointCloudLoader(self, file_path, self._load_generation, self._device)
+        loader.loaded.connect(lambda generation, result: self._on_loaded(generation, result, reset_camera))
+        loader.failed.connect(self._on_load_failed)
+        loader.finished.connect(lambda: self._loaders.discard(loader))
+        self._loaders.add(loader)  # 持有引用，线程结束前不被回收
+        loader.start()
+
+    def _on_load_failed(self, generation, message):
+        if generation == self._load_generation:
+            self.load_failed.emit(message)
+
+    def _on_loaded(self, generation, result, reset_camera):
+        # 期间又发起了新的加载，丢弃过期结果
+        if generation != self._load_generation or not self.vis:
+            return
+        self._pcd_full, pcd, chunked, device = result
+        if device != self._device:
+            self._device = device  # 迁移到 GPU 失败，后续加载直接在 CPU 上计算
+        if reset_camera is None:
+            reset_camera = self._first_load
+        self._first_load = False
+        if chunked is not None:
+            # 大点云：分块逐帧注册，按视锥剔除
+            self._pcd = None
+            self._reset_camera_pending = reset_camera
+            self._show_chunked(*chunked)
+            return
+
+        # 嵌入模式：更新可视化器
+        self._clear_chunks()
+        if self._can_update_in_place(pcd):
+            # 原地覆盖已有几何体的顶点/颜色缓冲，避免重新分配并整体上传
+            self.vis.scene.scene.update_geometry("PointCloud", pcd, self._update_flags(pcd))
+            bbox = pcd.get_axis_aligned_bounding_box()
+            self._scene_bounds = (bbox.min_bound.numpy(), bbox.max_bound.numpy())
+        else:
+            if self.vis.scene.has_geometry("PointCloud"):
+                self.vis.remove_geometry("PointCloud")
+            self.vis.add_geometry("PointCloud", pcd, self._material)
+        self._pcd = pcd
+        if reset_camera:
+            self._reset_camera()
+
+    def clear(self):
+        """
+        清空场景中的点云，可视化器本身保持存活：
+        下次加载直接复用已初始化的 Filament 渲染器，不再重复初始化 GPU 资源。
+        """
+        self._load_generation += 1  # 丢弃仍在进行中的加载结果
+        # 请求加载线程中止并等待其退出，避免控件销毁时 QThread 仍在运行
+        for loader in list(self._loaders):
+            loader.requestInterruption()
+            loader.wait()
+        self._pcd = self._pcd_full = None
+        self._first_load = True
+        if not self.vis:
+            return
+        self._clear_chunks()
+        if self.vis.scene.has_geometry("PointCloud"):
+            self.vis.remove_geometry("PointCloud")
+
+    def closeEvent(self, event):
+        """关闭控件时只清空几何体；Open3D 应用的退出交给 MainWindow.closeEvent"""
+        logger.info("清空可视化器场景")
+        self.clear()
         event.accept()
-    def __del__(self):
-        # 安全销毁可视化器
-        if hasattr(self, 'vis') and self.vis:
-            try:
-                logger.info("销毁vis")
-                self.vis.destroy_window()
-            except:
-                pass
+
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
-        # 设置 OpenGL（提升兼容性）
-        fmt = QSurfaceFormat()
-        fmt.setVersion(3, 3)
-        fmt.setProfile(QSurfaceFormat.OpenGLContextProfile.CoreProfile)
-        fmt.setDepthBufferSize(24)
-        QSurfaceFormat.setDefaultFormat(fmt)
         self.setWindowTitle("PcdViewer")
         self.resize(1920, 1080)
 
+        # 先在后台开始导入 open3d，与窗口创建、显示并行
+        preload_open3d()
         self.point_cloud_widget = PointCloudWidget()
+        self.point_cloud_widget.load_failed.connect(
+            lambda message: QMessageBox.critical(self, "错误", f"无法加载点云:\n{message}")
+        )
         self.setCentralWidget(self.point_cloud_widget)
-        # self.create_menu()
+        # 菜单栏提供打开文件、重置视角与设置面板开关
+        self.create_menu()
 
     def create_menu(self):
         menubar = self.menuBar()
@@ -136,6 +780,10 @@ class MainWindow(QMainWindow):
         open_action.triggered.connect(self.open_file)
         file_menu.addAction(open_action)
 
+        view_menu = menubar.addMenu("视图")
+        view_menu.addAction(self.point_cloud_widget.reset_view_action)
+        view_menu.addAction(self.point_cloud_widget.settings_action)
+
         exit_action = QAction("退出", self)
         exit_action.setShortcut("Ctrl+Q")
         exit_action.triggered.connect(self.close)
@@ -165,4 +813,13 @@ class MainWindow(QMainWindow):
         if hasattr(self, 'point_cloud_widget'):
             self.point_cloud_widget.close()
 
+        # 退出Open3D应用，由它统一释放可视化器窗口与渲染资源
+        try:
+            app = gui.Application.instance
+            if app:
+                logger.info("退出 app")
+                app.quit()
+        except Exception as e:
+            logger.error("退出 Open3D 应用失败: %s", e)
+
         event.accept()
@@ -8,21 +8,30 @@ PySide6 项目打包工具
 用法:
   python tools/build.py --deploy          # 使用 pyside6-deploy
   python tools/build.py --pyinstaller     # 使用 PyInstaller
+  python tools/build.py --kernel          # 编译 RANSAC Cython/AVX2 内核
   python tools/build.py --help            # 显示帮助
 """
 
 import argparse
+import hashlib
+import importlib.metadata
+import mmap
 import subprocess
 import sys
 import os
 
 
 import platform
+import re
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-# 从 pyproject.toml 读取版本
-import tomli
+# 从 pyproject.toml 读取版本（3.11+ 使用标准库 tomllib，旧版本退回 tomli）
+try:
+    import tomllib as tomli
+except ImportError:
+    import tomli
 
 
 # ==============================
@@ -44,6 +53,13 @@ DIST_DIR = PROJECT_ROOT / "dist"
 APP_NAME = config["project"]["name"]
 VERSION = config["project"]["version"]
 ICON_PATH = RESOURCES_DIR / "icons" / "app.png"  # 通用 icon（.png），自动转格式
+KERNEL_PYX = SRC_DIR / "algo" / "ransac_kernel.pyx"  # RANSAC Cython/AVX2 内核
+# 应用用不到、但会被依赖分析递归带入的标准库模块
+PYINSTALLER_EXCLUDES = ["tkinter", "test", "unittest", "pydoc_data"]
+INPUTS_HASH_FILE = BUILD_DIR / ".inputs.sha256"  # 上次成功打包时的输入哈希
+OPEN3D_MANIFEST = PROJECT_ROOT / "tools" / ".open3d_data.manifest"  # open3d 数据文件清单缓存
+# 代码与二进制按完整文件名匹配，含 libfoo.so.1 这类带版本号的共享库
+CODE_FILE_RE = re.compile(r"\.(py|pyc|pyi|pyd|dll|dylib|so(\.\d+)*)$", re.IGNORECASE)
 
 # 平台特定配置
 IS_WINDOWS = platform.system() == "Windows"
@@ -63,24 +79,153 @@ def log_success(msg: str):
 def log_error(msg: str):
     print(f"\033[1;31m[ERROR]\033[0m {msg}", file=sys.stderr)
 
-def run_command(cmd: list, cwd=None):
+def run_command(cmd: list, cwd=None, env=None):
     """执行 shell 命令，带实时输出"""
     log_info(f"Running: {' '.join(cmd)}")
-    try:
-        result = subprocess.run(
-            cmd,
-            cwd=cwd,
-            check=True,
-            text=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT
-        )
-        print(result.stdout)
-        return result
-    except subprocess.CalledProcessError as e:
-        log_error(f"Command failed with exit code {e.returncode}")
-        print(e.output)
+    # 逐行转发子进程输出，不在内存中缓存全部日志
+    with subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        env=env,
+        text=True,
+        bufsize=1,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT
+    ) as proc:
+        for line in proc.stdout:
+            sys.stdout.write(line)
+        returncode = proc.wait()
+    if returncode != 0:
+        log_error(f"Command failed with exit code {returncode}")
         sys.exit(1)
+    return subprocess.CompletedProcess(cmd, returncode)
+
+
+def _fast_copy(src: Path, dst: Path):
+    """
+    复制单个大文件（最终 exe/二进制），走内核拷贝路径后补齐元数据，等价于 shutil.copy2
+    Windows 用 CopyFileW，Linux 用 os.sendfile，数据不经过 Python 缓冲区；其余平台用 shutil.copyfile
+    """
+    if IS_WINDOWS:
+        import ctypes
+        if not ctypes.windll.kernel32.CopyFileW(str(src), str(dst), False):
+            raise ctypes.WinError()
+    elif IS_LINUX:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            offset = 0
+            while remaining > 0:
+                sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, remaining)
+                if sent == 0:
+                    break
+                offset += sent
+                remaining -= sent
+    else:
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+
+
+def _parallel_copytree(src: Path, dst: Path, workers: int = 8):
+    """
+    多线程复制目录树（等价于 shutil.copytree(src, dst, dirs_exist_ok=True)）
+    目录串行创建，文件交给线程池并发 copy2；小文件多时复制受系统调用延迟限制，并发可明显提速
+    """
+    files = []
+    dirs = []
+    pending = [(Path(src), Path(dst))]
+    while pending:
+        src_dir, dst_dir = pending.pop()
+        dst_dir.mkdir(parents=True, exist_ok=True)
+        dirs.append((src_dir, dst_dir))
+        with os.scandir(src_dir) as entries:
+            for entry in entries:
+                target = dst_dir / entry.name
+                if entry.is_dir():
+                    pending.append((Path(entry.path), target))
+                else:
+                    files.append((entry.path, target))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # list() 取回结果，任一文件复制失败时在此抛出异常
+        list(pool.map(lambda item: shutil.copy2(*item), files))
+    # copy2 只保留文件元数据，目录元数据在文件写完后补齐
+    for src_dir, dst_dir in dirs:
+        shutil.copystat(src_dir, dst_dir)
+
+
+def _hash_inputs(extra: str = "") -> str:
+    """
+    计算打包输入的 SHA-256：src/ 与 resources/ 下的全部文件（含相对路径）、pyproject.toml、
+    Python 版本、当前环境已安装的全部发行包版本（依赖升级后须重新打包），以及 extra（如打包命令行）。
+    文件内容经 mmap 直接送入哈希，不额外拷贝
+    """
+    digest = hashlib.sha256(extra.encode())
+    digest.update(sys.version.encode())
+    installed = sorted(
+        f"{dist.metadata['Name']}=={dist.version}".lower()
+        for dist in importlib.metadata.distributions()
+        if dist.metadata['Name']
+    )
+    digest.update("\n".join(installed).encode())
+    files = [PROJECT_ROOT / "pyproject.toml"]
+    for root_dir in (SRC_DIR, RESOURCES_DIR):
+        for root, dirnames, filenames in os.walk(root_dir):
+            dirnames[:] = sorted(d for d in dirnames if d != "__pycache__")
+            files.extend(Path(root) / name for name in sorted(filenames) if not name.endswith(".pyc"))
+    for path in files:
+        digest.update(str(path.relative_to(PROJECT_ROOT)).encode())
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                continue  # 空文件无法 mmap
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                digest.update(mm)
+    return digest.hexdigest()
+
+
+def _open3d_data_args(sep: str) -> list:
+    """
+    生成 open3d 数据文件的 --add-data 参数，代替 --collect-data=open3d 每次遍历整个包目录。
+    清单由安装记录 (RECORD) 生成，按 (目录, 扩展名) 合并为通配符，缓存在 OPEN3D_MANIFEST；
+    首行记录 open3d 版本与 site-packages 路径，任一变化时重新生成。未安装 open3d 时退回 --collect-data
+    """
+    try:
+        version = importlib.metadata.version("open3d")
+        dist = importlib.metadata.distribution("open3d")
+    except importlib.metadata.PackageNotFoundError:
+        return ["--collect-data=open3d"]
+
+    header = f"open3d=={version}\t{dist.locate_file('')}"
+    lines = []
+    if OPEN3D_MANIFEST.exists():
+        cached = OPEN3D_MANIFEST.read_text(encoding="utf-8").splitlines()
+        if cached and cached[0] == header:
+            lines = cached[1:]
+
+    if not lines:
+        # 代码与二进制由 PyInstaller 依赖分析收集，这里只列数据文件
+        records = [r for r in dist.files or [] if r.parts[0] == "open3d" and "__pycache__" not in r.parts]
+        code_suffixes = {(r.parent, r.suffix) for r in records if CODE_FILE_RE.search(r.name)}
+        patterns = set()
+        for record in records:
+            if CODE_FILE_RE.search(record.name):
+                continue
+            src = Path(dist.locate_file(record))
+            dest = record.parent.as_posix()
+            # 无扩展名、或扩展名与同目录代码相同 (如 libfoo.so.1 与 data.1) 的文件按原名列出，
+            # 避免通配符把同目录的代码一起带上
+            wildcard = record.suffix and (record.parent, record.suffix) not in code_suffixes
+            name = f"*{record.suffix}" if wildcard else record.name
+            patterns.add(f"{src.parent / name}\t{dest}")
+        if not patterns:
+            return ["--collect-data=open3d"]
+        lines = sorted(patterns)
+        OPEN3D_MANIFEST.write_text("\n".join([header, *lines]) + "\n", encoding="utf-8")
+        log_info(f"Generated {OPEN3D_MANIFEST.name} ({len(lines)} entries)")
+
+    args = []
+    for line in lines:
+        src, dest = line.split("\t")
+        args.extend(["--add-data", f"{src}{sep}{dest}"])
+    return args
 
 
 def ensure_directories():
@@ -93,16 +238,26 @@ def get_icon_for_platform():
     """根据平台返回图标路径（自动转换）"""
     if IS_WINDOWS:
         icon = RESOURCES_DIR / "icons" / "app.ico"
-        if not icon.exists():
-            # 尝试用 png 生成 ico（需 Pillow）
-            try:
-                from PIL import Image
-                img = Image.open(ICON_PATH)
-                img.save(icon, format="ICO", sizes=[(256, 256)])
-                log_info(f"Generated {icon} from {ICON_PATH}")
-            except Exception as e:
-                log_error(f"Failed to generate .ico: {e}. Using default icon.")
-                return None
+        # 源 png 缺失时无法生成，只能沿用已有的 .ico
+        if not ICON_PATH.exists():
+            if icon.exists():
+                return str(icon)
+            log_error(f"Icon source missing: {ICON_PATH}. Using default icon.")
+            return None
+        # .ico 的 mtime 与源 png 对齐，作为缓存键：png 未更新则直接复用
+        src_mtime = ICON_PATH.stat().st_mtime_ns
+        if icon.exists() and icon.stat().st_mtime_ns >= src_mtime:
+            return str(icon)
+        # 尝试用 png 生成 ico（需 Pillow）
+        try:
+            from PIL import Image
+            img = Image.open(ICON_PATH)
+            img.save(icon, format="ICO", sizes=[(256, 256)])
+            os.utime(icon, ns=(src_mtime, src_mtime))
+            log_info(f"Generated {icon} from {ICON_PATH}")
+        except Exception as e:
+            log_error(f"Failed to generate .ico: {e}. Using default icon.")
+            return None
         return str(icon)
     elif IS_MACOS:
         icon = RESOURCES_DIR / "icons" / "app.icns"
@@ -114,6 +269,42 @@ def get_icon_for_platform():
         return str(ICON_PATH)  # .png 通常可直接用
 
 
+# ==============================
+# 扩展编译
+# ==============================
+def build_ransac_kernel():
+    """编译 RANSAC Cython/AVX2 内核，产物就地放在 src/algo 下（需 Cython 与 C 编译器）"""
+    log_info("⚙️ Building RANSAC kernel...")
+    try:
+        from Cython.Build import cythonize
+        from setuptools import Distribution, Extension
+    except ImportError as e:
+        log_error(f"Cython/setuptools not available: {e}")
+        sys.exit(1)
+
+    # 不加全局 ISA 选项：AVX2/FMA 只在内点统计函数上按 target 属性启用，
+    # 模块本身可在任何 x86-64 CPU 上导入，由 cpu_supported() 决定是否使用
+    if IS_WINDOWS:
+        compile_args = ["/O2", "/fp:fast"]
+    else:
+        compile_args = ["-O3", "-ffast-math"]
+
+    ext = Extension("algo.ransac_kernel", [str(KERNEL_PYX)], extra_compile_args=compile_args)
+    dist = Distribution({
+        "ext_modules": cythonize([ext], language_level=3),
+        "package_dir": {"": str(SRC_DIR)},
+    })
+    cmd = dist.get_command_obj("build_ext")
+    cmd.inplace = True
+    cmd.build_temp = str(BUILD_DIR / "kernel")
+    try:
+        dist.run_command("build_ext")
+    except Exception as e:
+        log_error(f"RANSAC kernel build failed: {e}")
+        sys.exit(1)
+    log_success(f"✅ RANSAC kernel built in {KERNEL_PYX.parent}")
+
+
 # ==============================
 # 打包方法
 # ==============================
@@ -154,10 +345,10 @@ def build_with_pyside6_deploy():
         if src_exe.exists():
             if IS_MACOS and src_exe.suffix == ".app":
                 # macOS: 打包为 .dmg（需 hdiutil，此处仅复制 .app）
-                shutil.copytree(src_exe, DIST_DIR / src_exe.name, dirs_exist_ok=True)
+                _parallel_copytree(src_exe, DIST_DIR / src_exe.name)
                 log_info(f"Copied {src_exe.name} to {DIST_DIR}")
             else:
-                shutil.copy2(src_exe, dst_exe)
+                _fast_copy(src_exe, dst_exe)
                 log_success(f"→ Output: {dst_exe}")
         else:
             log_error(f"Build output not found: {src_exe}")
@@ -184,6 +375,21 @@ def build_with_pyinstaller():
         "--noconfirm"
     ]
 
+    # 字节码按 -OO 编译：去掉 docstring 与 assert，包体更小、启动时读取更少
+    # PyInstaller 6.6 起支持 --optimize，旧版本通过 PYTHONOPTIMIZE 传给分析进程
+    env = None
+    try:
+        pyi_version = importlib.metadata.version("pyinstaller")
+        pyi_major_minor = tuple(int(part) for part in pyi_version.split(".")[:2])
+    except (importlib.metadata.PackageNotFoundError, ValueError):
+        pyi_major_minor = (0, 0)
+    if pyi_major_minor >= (6, 6):
+        cmd.extend(["--optimize", "2"])
+    else:
+        env = {**os.environ, "PYTHONOPTIMIZE": "2"}
+    for module in PYINSTALLER_EXCLUDES:
+        cmd.extend(["--exclude-module", module])
+
     # 平台特定参数
     if IS_WINDOWS:
         cmd.extend(["--windowed"])
@@ -193,7 +399,7 @@ def build_with_pyinstaller():
             cmd.extend(["--icon", icon])
         # 资源路径: "resources;resources"
         cmd.extend(["--add-data", f"{RESOURCES_DIR};resources"])
-        cmd.extend(["--collect-data=open3d"])
+        cmd.extend(_open3d_data_args(";"))
     elif IS_MACOS:
         cmd.extend(["--windowed"])
         # cmd.extend(["--onefile"])
@@ -202,15 +408,33 @@ def build_with_pyinstaller():
             cmd.extend(["--icon", icon])
         # 资源路径: "resources:resources"
         cmd.extend(["--add-data", f"{RESOURCES_DIR}:resources"])
-        cmd.extend(["--collect-data=open3d"])
+        cmd.extend(_open3d_data_args(":"))
     else:  # Linux
         cmd.extend(["--windowed"])
         # cmd.extend(["--onefile"])
-        cmd.extend(["--collect-data=open3d"])
+        cmd.extend(_open3d_data_args(":"))
 
     # 添加主脚本
     cmd.append(str(MAIN_SCRIPT))
 
+    # 输出路径
+    pyi_dist = PROJECT_ROOT / "dist"
+    if IS_WINDOWS:
+        src_exe = pyi_dist / f"{APP_NAME}.exe"
+        dst_exe = DIST_DIR / f"{APP_NAME}-{VERSION}-win64.exe"
+    elif IS_MACOS:
+        src_exe = pyi_dist / f"{APP_NAME}.app"
+        dst_exe = DIST_DIR / f"{APP_NAME}-{VERSION}-mac.app"
+    else:
+        src_exe = pyi_dist / APP_NAME
+        dst_exe = DIST_DIR / f"{APP_NAME}-{VERSION}-linux"
+
+    # 输入（源码、资源、pyproject、命令行）未变且产物仍在时，跳过清理与重新打包
+    inputs_hash = _hash_inputs(" ".join(cmd))
+    if dst_exe.exists() and INPUTS_HASH_FILE.exists() and INPUTS_HASH_FILE.read_text().strip() == inputs_hash:
+        log_success(f"✅ Inputs unchanged, reusing {dst_exe}")
+        return
+
     try:
         # 清理旧 build
         if (PROJECT_ROOT / "build").exists():
@@ -218,26 +442,19 @@ def build_with_pyinstaller():
         if (PROJECT_ROOT / "dist").exists():
             shutil.rmtree(PROJECT_ROOT / "dist")
 
-        run_command(cmd, cwd=PROJECT_ROOT)
+        run_command(cmd, cwd=PROJECT_ROOT, env=env)
 
         # 移动输出到项目 dist/
-        pyi_dist = PROJECT_ROOT / "dist"
-        if IS_WINDOWS:
-            src_exe = pyi_dist / f"{APP_NAME}.exe"
-            dst_exe = DIST_DIR / f"{APP_NAME}-{VERSION}-win64.exe"
-        elif IS_MACOS:
-            src_exe = pyi_dist / f"{APP_NAME}.app"
-            dst_exe = DIST_DIR / f"{APP_NAME}-{VERSION}-mac.app"
-        else:
-            src_exe = pyi_dist / APP_NAME
-            dst_exe = DIST_DIR / f"{APP_NAME}-{VERSION}-linux"
 
         if src_exe.exists():
             if src_exe.is_dir():  # macOS .app 是目录
-                shutil.copytree(src_exe, dst_exe, dirs_exist_ok=True)
+                _parallel_copytree(src_exe, dst_exe)
             else:
-                shutil.copy2(src_exe, dst_exe)
+                _fast_copy(src_exe, dst_exe)
             log_success(f"✅ PyInstaller build completed! → {dst_exe}")
+            # 记录本次输入哈希，下次输入不变时可跳过打包
+            BUILD_DIR.mkdir(exist_ok=True)
+            INPUTS_HASH_FILE.write_text(inputs_hash)
         else:
             log_error(f"PyInstaller output not found: {src_exe}")
 
@@ -262,6 +479,11 @@ def main():
         action="store_true",
         help="使用 PyInstaller 打包（兼容复杂依赖）"
     )
+    group.add_argument(
+        "--kernel",
+        action="store_true",
+        help="编译 RANSAC Cython/AVX2 内核（可选加速）"
+    )
     parser.add_argument(
         "--clean",
         action="store_true",
@@ -287,6 +509,8 @@ def main():
         build_with_pyside6_deploy()
     elif args.pyinstaller:
         build_with_pyinstaller()
+    elif args.kernel:
+        build_ransac_kernel()
 
 
 if __name__ == "__main__":